@@ -1,7 +1,17 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, File, UploadFile
 from pydantic import BaseModel
-from orchestrator import answer_query
+from typing import List, Optional
+from orchestrator import answer_query_detailed, router, prompt_builder, retrieval_policy
+from rag_module import retrieve_similar_docs, DocFilter
+from resilience_module import breaker_status
+from embedding_module import query_cache, shared_query_cache
+from ingest_module import get_ingest_queue, get_job_progress, get_job_store, resolve_paths, QueueFullError
+from config import INGEST_ALLOWED_ROOTS, INGEST_UPLOAD_DIR
+from pathlib import Path
+import shutil
 import logging
+import os
+import time
 import traceback
 
 # Configure logging
@@ -17,8 +27,28 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="AI RAG + SerpApi + Gemini")
 
+class RetrievalFilters(BaseModel):
+    file_types: Optional[List[str]] = None  # e.g. [".md", ".docx"]
+    filenames: Optional[List[str]] = None
+    sources: Optional[List[str]] = None  # paths from the ingestion root, e.g. documents/uploads/guide.md
+    ingested_after: Optional[int] = None  # unix timestamp
+    ingested_before: Optional[int] = None
+
+    def to_doc_filter(self):
+        return DocFilter(
+            file_types=self.file_types or [],
+            filenames=self.filenames or [],
+            sources=self.sources or [],
+            ingested_after=self.ingested_after,
+            ingested_before=self.ingested_before
+        )
+
 class QueryRequest(BaseModel):
     query: str
+    filters: Optional[RetrievalFilters] = None
+
+class IngestRequest(BaseModel):
+    paths: List[str]  # files or folders under INGEST_ALLOWED_ROOTS
 
 @app.post("/ask")
 def ask_question(req: QueryRequest):
@@ -36,10 +66,12 @@ def ask_question(req: QueryRequest):
         
         # Process query
         logger.info("Starting query processing...")
-        answer = answer_query(req.query.strip())
+        refresh_if_ingested()
+        doc_filter = req.filters.to_doc_filter() if req.filters else None
+        answer = answer_query_detailed(req.query.strip(), doc_filter=doc_filter)
         
-        logger.info(f"Query processed successfully. Answer length: {len(answer) if answer else 0}")
-        return {"answer": answer, "status": "success"}
+        logger.info(f"Query processed successfully. Answer length: {len(answer.text) if answer.text else 0}")
+        return {"answer": answer.text, "sources": answer.citations, "status": "success"}
         
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
@@ -52,6 +84,84 @@ def ask_question(req: QueryRequest):
             "query": req.query
         }
 
+@app.post("/retrieve")
+def retrieve(req: QueryRequest):
+    """Document retrieval only (no web search or Gemini); also the target for bench_workers.py"""
+    if not req.query or len(req.query.strip()) == 0:
+        return {"error": "Query cannot be empty"}
+    
+    doc_filter = req.filters.to_doc_filter() if req.filters else None
+    results = retrieve_similar_docs(req.query.strip(), doc_filter=doc_filter)
+    return {"results": [result.to_dict() for result in results], "status": "success"}
+
+def refresh_after_ingest(job):
+    # Re-read hot documents so the cached prompt prefix reflects the new text
+    prompt_builder.refresh_hot_documents()
+
+# Ingestion generation this worker's prompt prefix was built for; see refresh_if_ingested()
+_prefix_generation = {"seen": None, "checked_at": 0.0}
+
+def refresh_if_ingested(min_interval=5.0):
+    """Reload hot documents when a job finished in any worker (checked at most every min_interval seconds)"""
+    now = time.monotonic()
+    if now - _prefix_generation["checked_at"] < min_interval:
+        return
+    _prefix_generation["checked_at"] = now
+    generation = get_job_store().generation()
+    if generation is None or generation == _prefix_generation["seen"]:
+        return
+    if _prefix_generation["seen"] is not None:
+        logger.info(f"Documents changed (ingestion generation {generation}), refreshing prompt prefix")
+        prompt_builder.refresh_hot_documents()
+    _prefix_generation["seen"] = generation
+
+def queue_ingest_job(files):
+    try:
+        job = get_ingest_queue(on_job_done=refresh_after_ingest).submit(files)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"job_id": job.id, "status": job.status, "files": job.files}
+
+@app.post("/ingest")
+def ingest_paths(req: IngestRequest):
+    """Queue files or folders already on the server for background ingestion"""
+    logger.info(f"Ingestion requested for paths: {req.paths}")
+    try:
+        files = resolve_paths(req.paths, INGEST_ALLOWED_ROOTS)
+    except ValueError as e:
+        logger.warning(f"Rejected ingestion request: {e}")
+        return {"error": str(e), "status": "error"}
+    if not files:
+        return {"error": "No supported files (.txt, .md, .pdf, .docx) found", "status": "error"}
+    return queue_ingest_job(files)
+
+@app.post("/ingest/files")
+def ingest_files(files: List[UploadFile] = File(...)):
+    """Save uploaded files and queue them for background ingestion"""
+    from upload_enhanced import SUPPORTED_EXTENSIONS
+    
+    upload_dir = Path(INGEST_UPLOAD_DIR)
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    saved = []
+    for upload in files:
+        name = Path(upload.filename or "").name
+        if Path(name).suffix.lower() not in SUPPORTED_EXTENSIONS:
+            return {"error": f"Unsupported file type: {upload.filename}", "status": "error"}
+        destination = upload_dir / name
+        with open(destination, "wb") as out:
+            shutil.copyfileobj(upload.file, out)
+        saved.append(destination)
+    logger.info(f"Saved {len(saved)} uploaded file(s) to {upload_dir}")
+    return queue_ingest_job(saved)
+
+@app.get("/ingest/{job_id}")
+def ingest_status(job_id: str):
+    """Progress and throughput of an ingestion job, whichever worker is running it"""
+    progress = get_job_progress(job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job: {job_id}")
+    return progress
+
 @app.get("/")
 def health_check():
     logger.info("Health check requested")
@@ -82,7 +192,14 @@ def debug_info():
                 "serpapi_key_set": bool(getattr(__import__('config'), 'SERPAPI_API_KEY', None)),
                 "qdrant_url_set": bool(getattr(__import__('config'), 'QDRANT_URL', None)),
                 "qdrant_api_key_set": bool(getattr(__import__('config'), 'QDRANT_API_KEY', None))
-            }
+            },
+            "router": router.stats(),
+            "retrieval_policy": retrieval_policy.stats(),
+            "prompt_cache": {tier.name: tier.model.stats() for tier in (router.fast, router.pro)},
+            "breakers": breaker_status(),
+            "query_cache": query_cache.stats(),
+            "shared_cache": shared_query_cache.stats() if shared_query_cache else None,
+            "pid": os.getpid()
         }
         
         return debug_data
@@ -0,0 +1,140 @@
+"""
+Load test for the multi-worker serving mode.
+Starts gunicorn with 1, 2, 4, ... workers in turn, drives /retrieve with concurrent
+clients and reports how throughput scales with the number of worker processes.
+
+    python bench_workers.py --workers 1,2,4,8 --duration 20
+    python bench_workers.py --url http://localhost:8000 --no-spawn   # against a running server
+"""
+
+import argparse
+import itertools
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+QUERIES = [
+    "Facebook Ads targeting",
+    "What are Facebook campaign objectives?",
+    "How do I add an ad account in Business Manager?",
+    "What is a lookalike audience?",
+    "Which fields does the Meta campaign object have?",
+    "How do carousel ads work?",
+    "What are special ad categories?",
+    "How should I set a daily or lifetime budget?",
+]
+
+def wait_until_ready(url, timeout=180):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+def run_load(url, endpoint, concurrency, duration, unique):
+    """Drive the endpoint from `concurrency` threads for `duration` seconds"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = itertools.count()
+    stop_at = time.time() + duration
+
+    def client():
+        session = requests.Session()
+        while time.time() < stop_at:
+            n = next(counter)
+            query = QUERIES[n % len(QUERIES)]
+            if unique:
+                # Defeat the query caches so every request exercises the encoder
+                query = f"{query} #{n}"
+            start = time.perf_counter()
+            try:
+                response = session.post(f"{url}{endpoint}", json={"query": query}, timeout=30)
+                ok = response.status_code == 200 and "error" not in response.json()
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.time() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "p50_ms": 1000 * statistics.median(latencies) if latencies else None,
+        "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+    }
+
+def start_server(workers, port):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}")
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "-c", "gunicorn.conf.py"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+def print_result(label, result, baseline=None):
+    speedup = f"{result['throughput'] / baseline:.2f}x" if baseline else "-"
+    p50 = f"{result['p50_ms']:.0f}" if result['p50_ms'] is not None else "-"
+    p95 = f"{result['p95_ms']:.0f}" if result['p95_ms'] is not None else "-"
+    print(f"{label:>8} | {result['throughput']:8.1f} req/s | {speedup:>7} | p50 {p50:>6} ms | "
+          f"p95 {p95:>6} ms | {result['requests']} ok, {result['errors']} errors")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput vs worker count load test")
+    parser.add_argument("--workers", default=",".join(str(n) for n in (1, 2, 4, 8) if n <= os.cpu_count()),
+                        help="comma-separated worker counts to test")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load per run")
+    parser.add_argument("--clients-per-worker", type=int, default=4)
+    parser.add_argument("--endpoint", default="/retrieve")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cached", action="store_true", help="repeat queries instead of making each one unique")
+    parser.add_argument("--url", help="base URL of an already running server")
+    parser.add_argument("--no-spawn", action="store_true", help="do not start gunicorn; load --url instead")
+    args = parser.parse_args()
+
+    print("=== Multi-worker Load Test ===")
+    print(f"CPU cores: {os.cpu_count()}, endpoint: {args.endpoint}, {args.duration:.0f}s per run\n")
+
+    if args.no_spawn:
+        url = args.url or "http://localhost:8000"
+        result = run_load(url, args.endpoint, args.clients_per_worker, args.duration, not args.cached)
+        print_result("server", result)
+        sys.exit(0)
+
+    baseline = None
+    for workers in [int(n) for n in args.workers.split(",")]:
+        url = f"http://127.0.0.1:{args.port}"
+        server = start_server(workers, args.port)
+        try:
+            if not wait_until_ready(url):
+                print(f"{workers:>8} | server did not start")
+                continue
+            # Warm up every worker before measuring
+            run_load(url, args.endpoint, workers * 2, 3.0, not args.cached)
+            result = run_load(url, args.endpoint, workers * args.clients_per_worker, args.duration, not args.cached)
+            baseline = baseline or result["throughput"]
+            print_result(f"{workers}w", result, baseline)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
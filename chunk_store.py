@@ -0,0 +1,128 @@
+"""
+Local store of every ingested chunk, keyed by (source, chunk_id) where source is
+the file's normalized path (see upload_enhanced.source_path), so two files with
+the same name in different folders never mix. Retrieval searches small chunks
+and reads their neighbours from here to rebuild the surrounding passage,
+without another round trip to Qdrant.
+
+chunk_text, which produces those chunks, lives here too so it can be used
+without loading the ingestion dependencies.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def chunk_text(text, max_chars=1000, overlap=100):
+    """Split text into overlapping chunks for better retrieval"""
+    if len(text) <= max_chars:
+        return [text]
+    
+    chunks = []
+    start = 0
+    
+    while start < len(text):
+        end = start + max_chars
+        
+        # Try to end at a sentence boundary
+        if end < len(text):
+            # Look for sentence endings near the chunk boundary, at most half a chunk back
+            for i in range(end, end - min(200, max_chars // 2), -1):
+                if text[i] in '.!?':
+                    end = i + 1
+                    break
+        
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        
+        # Always move forward, even when the overlap is as long as a short chunk
+        start = max(end - overlap, start + 1)
+        
+        if start >= len(text):
+            break
+    
+    return chunks
+
+
+class ChunkStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _conn(self):
+        # sqlite3 connections must not cross threads or fork boundaries
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+            if columns and "source" not in columns:
+                # Stores written before chunks were keyed by source; rebuilt by the next ingestion
+                logger.warning(f"Dropping chunk store table keyed by filename in {self.path}; re-ingest to rebuild it")
+                with conn:
+                    conn.execute("DROP TABLE chunks")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                " source TEXT NOT NULL, filename TEXT NOT NULL, chunk_id INTEGER NOT NULL,"
+                " total_chunks INTEGER NOT NULL, text TEXT NOT NULL, ingested_at INTEGER,"
+                " PRIMARY KEY (source, chunk_id))"
+            )
+            if columns and "source" in columns and "ingested_at" not in columns:
+                # Rows stored before versions were recorded match no version; expansion reads Qdrant instead
+                with conn:
+                    conn.execute("ALTER TABLE chunks ADD COLUMN ingested_at INTEGER")
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_filename ON chunks (filename)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def replace_file(self, source, filename, chunks, ingested_at=None):
+        """Store all chunks of one version of a file, dropping whatever was stored for it before"""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            conn.executemany(
+                "INSERT INTO chunks (source, filename, chunk_id, total_chunks, text, ingested_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(source, filename, i, len(chunks), text, ingested_at) for i, text in enumerate(chunks)]
+            )
+
+    def get_range(self, source, first, last, ingested_at=None):
+        """
+        Return {chunk_id: text} for chunk ids first..last of a file (missing ids are skipped).
+        With ingested_at, only if the stored chunks are that version of the file.
+        """
+        if not self.exists():
+            return {}
+        query = "SELECT chunk_id, text FROM chunks WHERE source = ? AND chunk_id BETWEEN ? AND ?"
+        params = (source, first, last)
+        if ingested_at is not None:
+            query += " AND ingested_at = ?"
+            params += (ingested_at,)
+        try:
+            rows = self._conn().execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Chunk store read failed: {e}")
+            return {}
+        return dict(rows)
+
+    def find_sources(self, filename):
+        """Sources of every stored file with this bare filename, sorted"""
+        if not self.exists():
+            return []
+        try:
+            rows = self._conn().execute(
+                "SELECT DISTINCT source FROM chunks WHERE filename = ? ORDER BY source", (filename,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Chunk store read failed: {e}")
+            return []
+        return [row[0] for row in rows]
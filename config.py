@@ -9,6 +9,7 @@ QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
+QDRANT_PATH = os.getenv("QDRANT_PATH", "")  # embedded on-disk index (no server, one process at a time), used when no cloud URL is set
 PRIORITY_LINKS = [
     "https://en-gb.facebook.com/business/help/621956575422138?id=649869995454285",
     "https://www.eachspy.com/facebook-ads-interests/",
@@ -18,3 +19,69 @@ PRIORITY_LINKS = [
     "https://developers.facebook.com/docs/marketing-api/reference/ad-campaign-group"
     # Add prioritized site(s)
 ]
+
+# Tiered model routing: easy queries go to the fast model, hard ones to pro
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash")
+GEMINI_PRO_MODEL = os.getenv("GEMINI_PRO_MODEL", "gemini-2.5-pro")
+ROUTER_LATENCY_SLO_MS = int(os.getenv("ROUTER_LATENCY_SLO_MS", 12000))
+ROUTER_MIN_FAST_SCORE = float(os.getenv("ROUTER_MIN_FAST_SCORE", 0.45))  # top retrieval score needed to try the fast model
+ROUTER_MAX_FAST_WORDS = int(os.getenv("ROUTER_MAX_FAST_WORDS", 25))
+# Prices in USD per 1M tokens (input, output), used for cost accounting only
+GEMINI_FAST_COST = (float(os.getenv("GEMINI_FAST_COST_IN", 0.30)), float(os.getenv("GEMINI_FAST_COST_OUT", 2.50)))
+GEMINI_PRO_COST = (float(os.getenv("GEMINI_PRO_COST_IN", 1.25)), float(os.getenv("GEMINI_PRO_COST_OUT", 10.00)))
+
+# Resilience: per-request latency budget, per-dependency timeouts and circuit breakers
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", 25))
+SERPAPI_TIMEOUT_SECONDS = float(os.getenv("SERPAPI_TIMEOUT_SECONDS", 4))
+SERPAPI_BUDGET_SECONDS = float(os.getenv("SERPAPI_BUDGET_SECONDS", 8))  # whole web search stage, all sites together
+QDRANT_TIMEOUT_SECONDS = float(os.getenv("QDRANT_TIMEOUT_SECONDS", 3))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", 15))
+GEMINI_MIN_BUDGET_SECONDS = float(os.getenv("GEMINI_MIN_BUDGET_SECONDS", 2))  # below this, degrade to the context-only answer
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 3))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", 30))
+DEPENDENCY_THREADS = int(os.getenv("DEPENDENCY_THREADS", 16))  # call threads per dependency, so one hung service cannot starve the others
+
+# Embeddings and the query embedding cache
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 384))  # output size of EMBEDDING_MODEL_NAME; change the two together
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 4096))
+QUERY_CACHE_DTYPE = os.getenv("QUERY_CACHE_DTYPE", "float16")  # float16 or float32
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH", "")  # e.g. ./cache/query_embeddings.npy; empty keeps it in memory
+
+# Multi-worker serving (see gunicorn.conf.py)
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", "")  # Unix socket of embedding_server.py; empty loads the model in-process
+EMBEDDING_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_TIMEOUT_SECONDS", 10))  # per request to the embedding server
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")  # SQLite file shared by all workers, e.g. ./cache/shared.db
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", 50000))
+
+# Chunking: embed small chunks for search precision, expand to neighbors at read time
+EMBED_CHUNK_CHARS = int(os.getenv("EMBED_CHUNK_CHARS", 300))
+CHUNK_OVERLAP_CHARS = int(os.getenv("CHUNK_OVERLAP_CHARS", 50))
+PARENT_CONTEXT_CHARS = int(os.getenv("PARENT_CONTEXT_CHARS", 800))  # passage size sent to Gemini per hit
+CHUNK_STORE_PATH = os.getenv("CHUNK_STORE_PATH", "chunk_store.db")  # written by upload_enhanced; Qdrant scroll if missing
+DOC_CONTEXT_SHARE = float(os.getenv("DOC_CONTEXT_SHARE", 0.6))  # share of the prompt context for our documents, the rest for web results
+
+# Prompt prefix reuse: hot documents go into the cached prefix after the system instructions
+HOT_DOCUMENTS = [name.strip() for name in os.getenv("HOT_DOCUMENTS", "facebook_ads_guide.md,meta_campaign_schema.md").split(",") if name.strip()]
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", 3600))
+
+# Background ingestion (/ingest endpoints)
+INGEST_CPU_SHARE = float(os.getenv("INGEST_CPU_SHARE", 0.25))  # fraction of time CPU-heavy ingestion stages may run
+INGEST_MAX_QUEUED_JOBS = int(os.getenv("INGEST_MAX_QUEUED_JOBS", 10))
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", 32))
+INGEST_UPSERT_BATCH = int(os.getenv("INGEST_UPSERT_BATCH", 100))
+INGEST_ALLOWED_ROOTS = [root.strip() for root in os.getenv("INGEST_ALLOWED_ROOTS", "./documents").split(",") if root.strip()]
+INGEST_UPLOAD_DIR = os.getenv("INGEST_UPLOAD_DIR", "./documents/uploads")
+INGEST_JOB_STORE_PATH = os.getenv("INGEST_JOB_STORE_PATH", "ingest_jobs.db")  # SQLite file with job progress, read by every worker
+
+# Adaptive retrieval (thresholds are cosine scores). "auto" turns it on once
+# `python eval_retrieval.py --build --calibrate --write-calibration` has written thresholds
+# for the current embedding model to RETRIEVAL_CALIBRATION_PATH; "false" keeps it off
+ADAPTIVE_RETRIEVAL_ENABLED = os.getenv("ADAPTIVE_RETRIEVAL_ENABLED", "auto").lower()  # auto, true or false
+RETRIEVAL_CALIBRATION_PATH = os.getenv("RETRIEVAL_CALIBRATION_PATH", "retrieval_calibration.json")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 3))
+RETRIEVAL_MAX_TOP_K = int(os.getenv("RETRIEVAL_MAX_TOP_K", 8))  # top_k used when scores are flat
+# Overrides of the calibrated thresholds; empty uses the calibration file
+RETRIEVAL_CONFIDENT_SCORE = os.getenv("RETRIEVAL_CONFIDENT_SCORE", "")  # top score that skips the web search
+RETRIEVAL_FLAT_SPREAD = os.getenv("RETRIEVAL_FLAT_SPREAD", "")  # top minus top_k-th score below which scores are flat
@@ -0,0 +1,278 @@
+"""
+Shared embedding model and a bounded cache of query embeddings.
+Queries are keyed by normalized text, so repeats of "Facebook Ads targeting?" and
+"facebook  ads targeting" skip the encoder. The cache can be persisted to a file
+so a restarted worker starts warm.
+"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no other workers to coordinate with
+    fcntl = None
+
+from config import (
+    EMBEDDING_MODEL_NAME, EMBEDDING_DIM, EMBEDDING_SOCKET, EMBEDDING_TIMEOUT_SECONDS,
+    QUERY_CACHE_SIZE, QUERY_CACHE_DTYPE, QUERY_CACHE_PATH, SHARED_CACHE_PATH, SHARED_CACHE_MAX_ENTRIES
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def load_local_model():
+    import sentence_transformers
+    logger.info(f"Loading embedding model: {EMBEDDING_MODEL_NAME}")
+    model = sentence_transformers.SentenceTransformer(EMBEDDING_MODEL_NAME)
+    if model.get_sentence_embedding_dimension() != EMBEDDING_DIM:
+        logger.error(f"{EMBEDDING_MODEL_NAME} returns {model.get_sentence_embedding_dimension()}-dim embeddings but "
+                     f"EMBEDDING_DIM is {EMBEDDING_DIM}; the query cache will not store them")
+    return model
+
+
+def get_embedding_model():
+    """
+    Return the process-wide embedding model. With EMBEDDING_SOCKET set this is a
+    client for the embedding sidecar (embedding_server.py) instead of a local copy.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                if EMBEDDING_SOCKET:
+                    from embedding_server import RemoteEmbeddingModel
+                    logger.info(f"Using embedding server at {EMBEDDING_SOCKET}")
+                    _model = RemoteEmbeddingModel(EMBEDDING_SOCKET, timeout=EMBEDDING_TIMEOUT_SECONDS)
+                else:
+                    _model = load_local_model()
+    return _model
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a query: case-folded, whitespace-collapsed, without surrounding punctuation"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" \t\n?!.,;:'\"")
+
+
+class EmbeddingCache:
+    """
+    LRU cache of embeddings stored in one preallocated (capacity x dim) array.
+    With a path, the array is saved as a .npy file with the key index next to it
+    as JSON, most-used entries last so they are evicted last. The array always
+    lives in private memory: worker processes each fill their own copy, and only
+    the one holding `<path>.lock` writes the files back (see gunicorn.conf.py).
+    The index records the model name and dim, so a file written for another model
+    is never served; with `dim` set, vectors of any other size are refused.
+    """
+
+    def __init__(self, capacity=4096, dtype="float16", path=None, model=None, dim=None):
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.model = model
+        self.dim = dim
+        self.vectors = None
+        self.slots = OrderedDict()  # key -> slot, least recently used first
+        self.counts = {}  # key -> number of lookups, used to order the warm start
+        self.free = []
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._puts_since_flush = 0
+        self._lock = threading.Lock()
+        self._writer_file = None
+        self._writer_pid = None
+        if path:
+            self._load()
+
+    def _index_path(self):
+        return f"{self.path}.keys.json"
+
+    def _allocate(self, dim):
+        self.vectors = np.zeros((self.capacity, dim), dtype=self.dtype)
+        self.free = list(range(self.capacity - 1, -1, -1))
+
+    def _load(self):
+        if not (os.path.exists(self.path) and os.path.exists(self._index_path())):
+            return
+        try:
+            # Read into private memory; a shared mapping would let workers overwrite each other's slots
+            vectors = np.load(self.path)
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if vectors.shape[0] != self.capacity or vectors.dtype != self.dtype:
+                logger.warning(f"Query cache file {self.path} does not match capacity/dtype, starting cold")
+                return
+            if (index.get("model") != self.model or index.get("dim") != vectors.shape[1]
+                    or (self.dim is not None and vectors.shape[1] != self.dim)):
+                logger.warning(f"Query cache file {self.path} was written for model {index.get('model')} "
+                               f"(dim {index.get('dim')}), not {self.model} (dim {self.dim}), starting cold")
+                return
+            if index.get("checksum") != zlib.crc32(vectors.tobytes()):
+                logger.warning(f"Query cache file {self.path} does not match its key index, starting cold")
+                return
+            self.vectors = vectors
+            used = set()
+            for key, slot, count in index["entries"]:
+                self.slots[key] = slot
+                self.counts[key] = count
+                used.add(slot)
+            self.free = [slot for slot in range(self.capacity - 1, -1, -1) if slot not in used]
+            logger.info(f"Warm-started query cache with {len(self.slots)} embeddings from {self.path}")
+        except Exception as e:
+            logger.warning(f"Could not load query cache from {self.path}: {e}")
+            self.vectors = None
+            self.slots.clear()
+            self.counts.clear()
+
+    def get(self, key):
+        """Return the cached embedding as a float32 array, or None"""
+        with self._lock:
+            slot = self.slots.get(key)
+            if slot is None or (self.dim is not None and self.vectors.shape[1] != self.dim):
+                self.misses += 1
+                return None
+            self.slots.move_to_end(key)
+            self.counts[key] += 1
+            self.hits += 1
+            self._dirty = True
+            return self.vectors[slot].astype(np.float32)
+
+    def put(self, key, vector):
+        vector = np.asarray(vector)
+        if vector.ndim != 1 or (self.dim is not None and vector.shape[0] != self.dim):
+            logger.warning(f"Refusing to cache an embedding of shape {vector.shape}, expected ({self.dim},)")
+            return
+        with self._lock:
+            if self.vectors is None:
+                self._allocate(vector.shape[-1])
+            if vector.shape[-1] != self.vectors.shape[1]:
+                logger.warning(f"Embedding dim {vector.shape[-1]} does not match cache dim {self.vectors.shape[1]}")
+                return
+            slot = self.slots.get(key)
+            if slot is None:
+                if not self.free:
+                    evicted, slot = self.slots.popitem(last=False)
+                    del self.counts[evicted]
+                else:
+                    slot = self.free.pop()
+                self.counts[key] = 1
+            self.slots[key] = slot
+            self.slots.move_to_end(key)
+            self.vectors[slot] = vector
+            self._dirty = True
+            self._puts_since_flush += 1
+
+    def is_writer(self):
+        """
+        Whether this process may write the cache files. The first process to flush
+        takes an exclusive lock on <path>.lock for its lifetime; the lock is taken
+        after fork, so a pre-forking master never hands it to all its workers.
+        """
+        if fcntl is None:
+            return True
+        if self._writer_pid != os.getpid():
+            self._writer_pid = os.getpid()
+            self._writer_file = open(f"{self.path}.lock", "a")
+            try:
+                fcntl.flock(self._writer_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                logger.info(f"Process {os.getpid()} writes the query cache file {self.path}")
+            except OSError:
+                self._writer_file.close()
+                self._writer_file = None
+        return self._writer_file is not None
+
+    def flush(self):
+        """Save the vectors and key index if this cache is file-backed and this process is its writer"""
+        if not self.path or self.vectors is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            self._puts_since_flush = 0
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            if not self.is_writer():
+                return
+            # Most frequently used last, so a warm-started LRU evicts rarely used queries first
+            entries = sorted(((key, slot, self.counts[key]) for key, slot in self.slots.items()),
+                             key=lambda entry: entry[2])
+            # Whole-file replaces, so a starting process never reads a half-written file
+            tmp_path = f"{self.path}.tmp.npy"
+            np.save(tmp_path, self.vectors)
+            os.replace(tmp_path, self.path)
+            tmp_path = f"{self._index_path()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model, "dim": self.vectors.shape[1], "entries": entries,
+                           "checksum": zlib.crc32(self.vectors.tobytes())}, f)
+            os.replace(tmp_path, self._index_path())
+            self._dirty = False
+
+    def maybe_flush(self, every=64):
+        """Flush after every N new entries so a crashed worker loses little of its warm set"""
+        if self._puts_since_flush >= every:
+            self.flush()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.slots),
+                "capacity": self.capacity,
+                "dtype": str(self.dtype),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "path": self.path,
+                "writer": self._writer_file is not None if self.path and fcntl else None,
+            }
+
+
+query_cache = EmbeddingCache(QUERY_CACHE_SIZE, QUERY_CACHE_DTYPE, QUERY_CACHE_PATH or None,
+                             model=EMBEDDING_MODEL_NAME, dim=EMBEDDING_DIM)
+atexit.register(query_cache.flush)
+
+# Second tier shared by all worker processes (see shared_cache.py)
+shared_query_cache = None
+if SHARED_CACHE_PATH:
+    from shared_cache import SharedCache
+    shared_query_cache = SharedCache(SHARED_CACHE_PATH, SHARED_CACHE_MAX_ENTRIES,
+                                     namespace=f"query_embedding:{EMBEDDING_MODEL_NAME}:{EMBEDDING_DIM}:{QUERY_CACHE_DTYPE}")
+
+
+def embed_query(text: str) -> list:
+    """Embed a search query, reusing cached embeddings for normalized repeats"""
+    key = normalize_query(text)
+    cached = query_cache.get(key)
+    if cached is not None:
+        logger.debug(f"Query embedding cache hit for: '{key}'")
+        return cached.tolist()
+
+    if shared_query_cache is not None:
+        blob = shared_query_cache.get(key)
+        if blob is not None:
+            embedding = np.frombuffer(blob, dtype=query_cache.dtype)
+            if embedding.shape[0] == EMBEDDING_DIM:
+                query_cache.put(key, embedding)
+                return embedding.astype(np.float32).tolist()
+
+    embedding = get_embedding_model().encode([text])[0]
+    if shared_query_cache is not None:
+        shared_query_cache.put(key, np.asarray(embedding, dtype=query_cache.dtype).tobytes())
+    query_cache.put(key, embedding)
+    query_cache.maybe_flush()
+    return np.asarray(embedding, dtype=np.float32).tolist()
@@ -0,0 +1,188 @@
+"""
+Embedding sidecar: one process holds the sentence-transformers model and serves
+encode requests to every API worker over a local Unix socket.
+
+Run it next to the API workers and point them at it:
+    python embedding_server.py --socket /tmp/websearch_rag_embed.sock
+    EMBEDDING_SOCKET=/tmp/websearch_rag_embed.sock gunicorn app:app -c gunicorn.conf.py
+
+Wire format (all integers big-endian uint32):
+    request:  length, then a UTF-8 JSON body {"texts": [...]}
+    response: rows, dim, then rows*dim float32 values; rows == 0xFFFFFFFF means an
+              error and is followed by length and a UTF-8 message
+"""
+
+import argparse
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ERROR_ROWS = 0xFFFFFFFF
+HEADER = struct.Struct(">II")
+LENGTH = struct.Struct(">I")
+
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("Embedding socket closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+class _Batcher:
+    """Coalesces concurrent requests into one model.encode call"""
+
+    def __init__(self, model, max_batch=64, max_wait=0.005):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+
+    def encode(self, texts):
+        done = threading.Event()
+        slot = {"texts": texts, "done": done}
+        self.requests.put(slot)
+        done.wait()
+        if "error" in slot:
+            raise slot["error"]
+        return slot["result"]
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            count = len(batch[0]["texts"])
+            while count < self.max_batch:
+                try:
+                    slot = self.requests.get(timeout=self.max_wait)
+                except queue.Empty:
+                    break
+                batch.append(slot)
+                count += len(slot["texts"])
+
+            texts = [text for slot in batch for text in slot["texts"]]
+            try:
+                vectors = np.asarray(self.model.encode(texts, batch_size=self.max_batch), dtype=np.float32)
+                start = 0
+                for slot in batch:
+                    end = start + len(slot["texts"])
+                    slot["result"] = vectors[start:end]
+                    start = end
+            except Exception as e:
+                for slot in batch:
+                    slot["error"] = e
+            for slot in batch:
+                slot["done"].set()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                (length,) = LENGTH.unpack(_recv_exact(self.request, LENGTH.size))
+                texts = json.loads(_recv_exact(self.request, length).decode("utf-8"))["texts"]
+            except ConnectionError:
+                return
+            if not texts:
+                self.request.sendall(HEADER.pack(0, 0))
+                continue
+            try:
+                vectors = self.server.batcher.encode(texts)
+                self.request.sendall(HEADER.pack(*vectors.shape) + vectors.tobytes())
+            except Exception as e:
+                message = str(e).encode("utf-8")
+                self.request.sendall(HEADER.pack(ERROR_ROWS, 0) + LENGTH.pack(len(message)) + message)
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, model):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _Handler)
+        self.batcher = _Batcher(model)
+
+
+class RemoteEmbeddingModel:
+    """
+    Client with the subset of the SentenceTransformer API the app uses.
+    A request that gets no reply within `timeout` seconds raises TimeoutError and
+    drops its connection, so a late reply can never be read as the next answer.
+    """
+
+    def __init__(self, socket_path, timeout=10.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._dim = None
+
+    def _sock(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None or getattr(self._local, "pid", None) != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+            self._local.pid = os.getpid()
+        return sock
+
+    def encode(self, sentences, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self._dim or 0), dtype=np.float32)
+        body = json.dumps({"texts": texts}).encode("utf-8")
+        try:
+            sock = self._sock()
+            sock.sendall(LENGTH.pack(len(body)) + body)
+            rows, dim = HEADER.unpack(_recv_exact(sock, HEADER.size))
+            if rows == ERROR_ROWS:
+                (length,) = LENGTH.unpack(_recv_exact(sock, LENGTH.size))
+                raise RuntimeError(f"Embedding server error: {_recv_exact(sock, length).decode('utf-8')}")
+            vectors = np.frombuffer(_recv_exact(sock, rows * dim * 4), dtype=np.float32).reshape(rows, dim)
+        except (OSError, ConnectionError):
+            # Drop the broken or timed-out connection so the next call reconnects
+            sock = getattr(self._local, "sock", None)
+            if sock is not None:
+                sock.close()
+            self._local.sock = None
+            raise
+        self._dim = dim
+        return vectors[0] if single else vectors
+
+    def get_sentence_embedding_dimension(self):
+        if self._dim is None:
+            self.encode("dimension probe")
+        return self._dim
+
+
+if __name__ == "__main__":
+    from config import EMBEDDING_SOCKET
+    from embedding_module import load_local_model
+
+    parser = argparse.ArgumentParser(description="Serve embeddings to API workers over a Unix socket")
+    parser.add_argument("--socket", default=EMBEDDING_SOCKET or "/tmp/websearch_rag_embed.sock")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server = EmbeddingServer(args.socket, load_local_model())
+    logger.info(f"Embedding server listening on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
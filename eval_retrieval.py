@@ -0,0 +1,263 @@
+"""
+Retrieval quality and latency regression harness.
+Runs the labeled questions in eval_questions.json through retrieve_similar_docs
+against an embedded local index (no Qdrant server, SerpAPI or Gemini calls) and
+reports recall@k and MRR at file level together with latency percentiles, so a
+change to chunking, caches, quantization or ANN parameters can be judged on
+both quality and speed.
+
+    python eval_retrieval.py --build                     # (re)build ./eval_index from ./documents
+    python eval_retrieval.py --save eval_baseline.json   # record a baseline
+    python eval_retrieval.py --compare eval_baseline.json  # exit 1 on a regression
+    python eval_retrieval.py --calibrate                 # suggest adaptive retrieval thresholds
+    python eval_retrieval.py --calibrate --write-calibration  # ... and turn adaptive retrieval on with them
+
+A retrieval error (missing index, Qdrant or model failure) stops the run with
+exit code 2 instead of being scored as a miss.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+DEFAULT_INDEX = "./eval_index"
+K_VALUES = (1, 3, 5)
+
+# Allowed drift before --compare reports a regression
+MAX_QUALITY_DROP = 0.02  # absolute drop in recall@k or MRR
+MAX_LATENCY_INCREASE = 0.20  # relative increase in p95 latency
+
+
+def use_local_index(index_dir):
+    """Point config at an embedded index; must run before config is imported (load_dotenv keeps these)"""
+    os.environ["QDRANT_URL"] = ""
+    os.environ["QDRANT_API_KEY"] = ""
+    os.environ["QDRANT_PATH"] = os.path.join(index_dir, "qdrant")
+    os.environ["CHUNK_STORE_PATH"] = os.path.join(index_dir, "chunk_store.db")
+    os.environ["QUERY_CACHE_PATH"] = ""
+    os.environ["SHARED_CACHE_PATH"] = ""
+    os.environ["EMBEDDING_SOCKET"] = ""
+
+
+def load_questions(path):
+    with open(path, encoding="utf-8") as f:
+        questions = json.load(f)
+    for q in questions:
+        if not q.get("question") or not q.get("relevant"):
+            raise ValueError(f"Question {q.get('id')} needs 'question' and 'relevant'")
+    return questions
+
+
+def build_index(documents_folder):
+    from upload_enhanced import process_documents_from_folder, upload_documents
+    upload_documents(process_documents_from_folder(documents_folder))
+
+
+def ranked_files(results):
+    """Distinct filenames in rank order"""
+    files = []
+    for result in results:
+        filename = (result.metadata or {}).get("filename")
+        if filename and filename not in files:
+            files.append(filename)
+    return files
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    return {
+        "count": len(latencies),
+        "mean_ms": round(1000 * statistics.fmean(latencies), 2) if latencies else None,
+        "p50_ms": round(1000 * percentile(latencies, 50), 2) if latencies else None,
+        "p95_ms": round(1000 * percentile(latencies, 95), 2) if latencies else None,
+        "p99_ms": round(1000 * percentile(latencies, 99), 2) if latencies else None,
+    }
+
+
+def evaluate(questions, retrieve, k_values=K_VALUES, warm_passes=3):
+    """
+    Score `retrieve(query, top_k)` on the question set.
+    The first pass is timed as cold (empty query cache), the repeats as warm.
+    """
+    max_k = max(k_values)
+    hits = {k: 0.0 for k in k_values}
+    reciprocal_ranks = []
+    cold, warm = [], []
+    per_question = []
+
+    for q in questions:
+        start = time.perf_counter()
+        results = retrieve(q["question"], max_k)
+        cold.append(time.perf_counter() - start)
+
+        files = ranked_files(results)
+        relevant = set(q["relevant"])
+        rank = next((i + 1 for i, filename in enumerate(files) if filename in relevant), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        for k in k_values:
+            # Fraction of the relevant files found in the top k
+            hits[k] += len(relevant.intersection(files[:k])) / len(relevant)
+        per_question.append({"id": q.get("id"), "rank": rank, "retrieved": files[:max_k]})
+
+    for _ in range(warm_passes):
+        for q in questions:
+            start = time.perf_counter()
+            retrieve(q["question"], max_k)
+            warm.append(time.perf_counter() - start)
+
+    n = len(questions)
+    return {
+        "questions": n,
+        "recall": {f"@{k}": round(hits[k] / n, 4) for k in k_values},
+        "mrr": round(sum(reciprocal_ranks) / n, 4),
+        "latency_cold": latency_summary(cold),
+        "latency_warm": latency_summary(warm),
+        "per_question": per_question,
+    }
+
+
+def calibration_samples(questions, retrieve, base_k, max_k):
+    """(raw chunk scores, top hit relevant, relevant hit within base_k) per question, for policy_module.calibrate"""
+    samples = []
+    for q in questions:
+        results = retrieve(q["question"], max_k)
+        relevant = set(q["relevant"])
+        files = [(r.metadata or {}).get("filename") for r in results]
+        samples.append((
+            [r.score for r in results],
+            bool(files) and files[0] in relevant,
+            bool(relevant.intersection(files[:base_k])),
+        ))
+    return samples
+
+
+def compare(report, baseline):
+    """List of regressions of `report` against `baseline`"""
+    problems = []
+    for key, value in baseline["recall"].items():
+        current = report["recall"].get(key)
+        if current is not None and current < value - MAX_QUALITY_DROP:
+            problems.append(f"recall{key} dropped from {value} to {current}")
+    if report["mrr"] < baseline["mrr"] - MAX_QUALITY_DROP:
+        problems.append(f"MRR dropped from {baseline['mrr']} to {report['mrr']}")
+    for phase in ("latency_cold", "latency_warm"):
+        before, after = baseline[phase]["p95_ms"], report[phase]["p95_ms"]
+        if before and after and after > before * (1 + MAX_LATENCY_INCREASE):
+            problems.append(f"{phase} p95 rose from {before} ms to {after} ms")
+    return problems
+
+
+def print_report(report, questions):
+    print(f"\nQuestions: {report['questions']}")
+    print("Recall:  " + "  ".join(f"{k} {v:.3f}" for k, v in report["recall"].items()))
+    print(f"MRR:     {report['mrr']:.3f}")
+    for phase in ("latency_cold", "latency_warm"):
+        s = report[phase]
+        print(f"{phase[8:]:>5} latency: p50 {s['p50_ms']} ms | p95 {s['p95_ms']} ms | p99 {s['p99_ms']} ms "
+              f"({s['count']} queries)")
+    misses = [p for p in report["per_question"] if p["rank"] is None]
+    if misses:
+        text = {q.get("id"): q["question"] for q in questions}
+        print("\nNo relevant file retrieved for:")
+        for p in misses:
+            print(f"  {p['id']}: {text.get(p['id'])} -> {p['retrieved']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval quality and latency evaluation")
+    parser.add_argument("--questions", default="eval_questions.json")
+    parser.add_argument("--index", default=DEFAULT_INDEX, help="directory of the embedded evaluation index")
+    parser.add_argument("--documents", default="./documents")
+    parser.add_argument("--build", action="store_true", help="(re)index --documents into --index first")
+    parser.add_argument("--warm-passes", type=int, default=3)
+    parser.add_argument("--no-expand", action="store_true", help="score raw chunks without neighbour expansion")
+    parser.add_argument("--save", help="write the report to this JSON file")
+    parser.add_argument("--compare", help="baseline report; exit 1 if quality or latency regressed")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="suggest RETRIEVAL_CONFIDENT_SCORE / RETRIEVAL_FLAT_SPREAD from the question set")
+    parser.add_argument("--target-precision", type=float, default=0.9,
+                        help="top-hit precision required before a query may skip the web search")
+    parser.add_argument("--write-calibration", action="store_true",
+                        help="with --calibrate, save the thresholds to RETRIEVAL_CALIBRATION_PATH for the app to use")
+    args = parser.parse_args()
+
+    use_local_index(args.index)
+    questions = load_questions(args.questions)
+
+    print("=== Retrieval Evaluation ===")
+    if args.build:
+        build_index(args.documents)
+
+    from rag_module import retrieve_similar_docs
+
+    def retrieve(query, top_k, expand):
+        try:
+            return retrieve_similar_docs(query, top_k=top_k, expand=expand, raise_errors=True)
+        except Exception as e:
+            print(f"\nRetrieval failed for {query!r}: {type(e).__name__}: {e}")
+            sys.exit(2)
+
+    if args.calibrate:
+        from config import RETRIEVAL_TOP_K, RETRIEVAL_MAX_TOP_K, RETRIEVAL_CALIBRATION_PATH, EMBEDDING_MODEL_NAME
+        from policy_module import calibrate
+
+        samples = calibration_samples(
+            questions,
+            lambda query, top_k: retrieve(query, top_k, expand=False),
+            RETRIEVAL_TOP_K, RETRIEVAL_MAX_TOP_K,
+        )
+        suggestion = calibrate(samples, RETRIEVAL_TOP_K, target_precision=args.target_precision)
+        print(f"\nCalibrated on {suggestion['samples']} questions (top_k={RETRIEVAL_TOP_K}, max={RETRIEVAL_MAX_TOP_K}):")
+        print(json.dumps(suggestion, indent=2))
+        if suggestion["confident_score"] is not None:
+            print(f"RETRIEVAL_CONFIDENT_SCORE={suggestion['confident_score']}")
+        else:
+            print(f"No score reaches {args.target_precision:.0%} top-hit precision; keep web search for every query")
+        if suggestion["flat_spread"] is not None:
+            print(f"RETRIEVAL_FLAT_SPREAD={suggestion['flat_spread']}")
+        if args.write_calibration:
+            calibration = {
+                "model": EMBEDDING_MODEL_NAME,
+                "base_k": RETRIEVAL_TOP_K,
+                "max_k": RETRIEVAL_MAX_TOP_K,
+                "target_precision": args.target_precision,
+                "questions": args.questions,
+                "calibrated_at": int(time.time()),
+                **suggestion,
+            }
+            with open(RETRIEVAL_CALIBRATION_PATH, "w", encoding="utf-8") as f:
+                json.dump(calibration, f, indent=2)
+            print(f"\nSaved calibration to {RETRIEVAL_CALIBRATION_PATH}; "
+                  f"adaptive retrieval uses it from the next app start")
+        sys.exit(0)
+
+    report = evaluate(
+        questions,
+        lambda query, top_k: retrieve(query, top_k, expand=not args.no_expand),
+        warm_passes=args.warm_passes,
+    )
+    print_report(report, questions)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved report to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            problems = compare(report, json.load(f))
+        if problems:
+            print("\nREGRESSIONS:")
+            for problem in problems:
+                print(f"  - {problem}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
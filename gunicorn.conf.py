@@ -0,0 +1,49 @@
+"""
+Gunicorn settings for running app:app under several uvicorn workers.
+
+    gunicorn app:app -c gunicorn.conf.py
+
+The app and the embedding model are loaded once in the master before forking,
+so workers share the model weights copy-on-write instead of each loading its
+own copy. For strict sharing (CPython refcounts still touch some pages), run
+embedding_server.py and set EMBEDDING_SOCKET so workers hold no model at all.
+Set SHARED_CACHE_PATH so all workers share one query embedding cache.
+
+QUERY_CACHE_PATH is not shared between workers: the file is read into each
+worker's private memory at startup, every worker keeps its own LRU state, and
+only the first worker to flush (holding QUERY_CACHE_PATH.lock) writes it back,
+with whole-file replaces. The other workers start warm from it but never write.
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+graceful_timeout = 30
+
+# Torch threads per worker; the default (all cores in every worker) oversubscribes the CPU
+threads_per_worker = int(os.getenv("EMBEDDING_THREADS_PER_WORKER", max(1, multiprocessing.cpu_count() // workers)))
+
+
+def on_starting(server):
+    # Runs in the master after preload_app imported the app and before any worker forks
+    from embedding_module import get_embedding_model
+    get_embedding_model()
+    # Move everything allocated so far out of the GC's reach so collections in
+    # workers do not write to (and un-share) the inherited pages
+    gc.collect()
+    gc.freeze()
+    server.log.info("Embedding model preloaded for copy-on-write sharing")
+
+
+def post_fork(server, worker):
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
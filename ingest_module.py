@@ -0,0 +1,406 @@
+"""
+Background ingestion queue behind the /ingest endpoints.
+Jobs run one at a time through a pipeline of stages connected by bounded queues
+(extract+chunk -> embed -> upsert), so parsing, encoding and network upserts
+overlap. CPU-heavy stages are duty-cycled so ingestion uses at most roughly
+INGEST_CPU_SHARE of a core's time and leaves the rest for /ask.
+Jobs run in the worker process that accepted them; their progress and a
+generation counter bumped after every job are kept in a SQLite JobStore so any
+worker can answer status polls and notice that the documents changed.
+"""
+
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from config import (
+    INGEST_CPU_SHARE, INGEST_MAX_QUEUED_JOBS, INGEST_EMBED_BATCH, INGEST_UPSERT_BATCH, INGEST_JOB_STORE_PATH
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # end-of-stream marker between stages
+
+
+class QueueFullError(Exception):
+    """Raised when too many ingestion jobs are already waiting"""
+
+
+@dataclass
+class IngestJob:
+    id: str
+    files: list
+    status: str = "queued"  # queued, running, done, done_with_errors (some files ingested), failed
+    created_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+    files_done: int = 0
+    files_ingested: int = 0  # files whose new version fully replaced the previous one
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_upserted: int = 0
+    stage_seconds: dict = field(default_factory=lambda: {"extract": 0.0, "embed": 0.0, "upsert": 0.0, "throttled": 0.0})
+    errors: list = field(default_factory=list)
+    saved_at: float = field(default=0.0, repr=False)  # monotonic time of the last JobStore save
+
+    def progress(self):
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "id": self.id,
+            "status": self.status,
+            "files_total": len(self.files),
+            "files_done": self.files_done,
+            "files_ingested": self.files_ingested,
+            "chunks_total": self.chunks_total,
+            "chunks_embedded": self.chunks_embedded,
+            "chunks_upserted": self.chunks_upserted,
+            "elapsed_seconds": round(elapsed, 2),
+            "chunks_per_second": round(self.chunks_upserted / elapsed, 2) if elapsed else None,
+            "stage_seconds": {stage: round(seconds, 2) for stage, seconds in self.stage_seconds.items()},
+            "errors": self.errors[-20:],
+        }
+
+
+class JobStore:
+    """Job progress and an ingestion generation counter shared by all processes that open the same path"""
+
+    RETENTION_SECONDS = 7 * 24 * 3600
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _conn(self):
+        # sqlite3 connections must not cross threads or fork boundaries
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, progress TEXT NOT NULL, updated_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def save(self, job):
+        try:
+            conn = self._conn()
+            conn.execute("INSERT OR REPLACE INTO jobs (id, progress, updated_at) VALUES (?, ?, ?)",
+                         (job.id, json.dumps(job.progress()), time.time()))
+            if job.status == "queued":
+                conn.execute("DELETE FROM jobs WHERE updated_at < ?", (time.time() - self.RETENTION_SECONDS,))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not save ingestion job {job.id}: {e}")
+
+    def load(self, job_id):
+        """Last saved progress of a job, or None"""
+        try:
+            row = self._conn().execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read ingestion job {job_id}: {e}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def generation(self):
+        """Number of ingestion jobs finished so far, across all workers"""
+        try:
+            row = self._conn().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read ingestion generation: {e}")
+            return None
+        return row[0] if row else 0
+
+    def bump_generation(self):
+        try:
+            self._conn().execute(
+                "INSERT INTO meta (key, value) VALUES ('generation', 1)"
+                " ON CONFLICT(key) DO UPDATE SET value = value + 1"
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not bump ingestion generation: {e}")
+
+
+class _Throttle:
+    """Duty-cycles a stage: after `t` seconds of work, idle t * (1 - share) / share seconds"""
+
+    def __init__(self, share):
+        self.share = min(1.0, max(0.05, share))
+
+    def run(self, fn, *args):
+        start = time.monotonic()
+        result = fn(*args)
+        busy = time.monotonic() - start
+        pause = busy * (1 - self.share) / self.share
+        if pause > 0:
+            time.sleep(pause)
+        return result, busy, pause
+
+
+class IngestQueue:
+    """
+    Accepts jobs (lists of files) and runs them on a background thread.
+    `stages` supplies the stage functions so the queue does not import the
+    heavy ingestion dependencies itself; see default_stages().
+    Jobs run in the process that accepted them; with a store, their progress is
+    saved as they run so other processes can report it.
+    """
+
+    def __init__(self, stages, max_queued=10, cpu_share=0.25, embed_batch=32, upsert_batch=100, on_job_done=None,
+                 store=None):
+        self.stages = stages
+        self.max_queued = max_queued
+        self.throttle = _Throttle(cpu_share)
+        self.embed_batch = embed_batch
+        self.upsert_batch = upsert_batch
+        self.on_job_done = on_job_done
+        self.store = store
+        self.jobs = {}
+        self._pending = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, files):
+        """Queue a job for the given file paths and return it"""
+        if self._pending.qsize() >= self.max_queued:
+            raise QueueFullError(f"{self.max_queued} ingestion jobs are already queued")
+        job = IngestJob(id=uuid.uuid4().hex[:12], files=[str(f) for f in files])
+        with self._lock:
+            self.jobs[job.id] = job
+            # Started lazily so no thread exists before a pre-forking server forks
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_jobs, name="ingest-worker", daemon=True)
+                self._worker.start()
+        self._save(job)
+        self._pending.put(job)
+        logger.info(f"Queued ingestion job {job.id} with {len(job.files)} file(s)")
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def progress(self, job_id):
+        """Progress of a job accepted by this process or, through the store, by any other"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.progress()
+        return self.store.load(job_id) if self.store else None
+
+    def _save(self, job, min_interval=0.0):
+        """Save job progress to the store, at most once per min_interval seconds"""
+        if self.store is None:
+            return
+        now = time.monotonic()
+        if now - job.saved_at >= min_interval:
+            job.saved_at = now
+            self.store.save(job)
+
+    def _run_jobs(self):
+        while True:
+            job = self._pending.get()
+            job.status = "running"
+            job.started_at = time.time()
+            self._save(job)
+            try:
+                self._run_pipeline(job)
+                if not job.errors:
+                    job.status = "done"
+                else:
+                    job.status = "done_with_errors" if job.files_ingested else "failed"
+            except Exception as e:
+                logger.error(f"Ingestion job {job.id} failed: {e}")
+                job.errors.append(str(e))
+                job.status = "failed"
+            job.finished_at = time.time()
+            logger.info(f"Ingestion job {job.id} {job.status}: {job.progress()}")
+            self._save(job)
+            if self.store is not None:
+                self.store.bump_generation()
+            if self.on_job_done:
+                try:
+                    self.on_job_done(job)
+                except Exception as e:
+                    logger.warning(f"Ingestion completion hook failed: {e}")
+
+    def _run_pipeline(self, job):
+        self.stages["prepare"]()
+        ingested_at = int(time.time())
+        chunks_q = queue.Queue(maxsize=4 * self.embed_batch)
+        points_q = queue.Queue(maxsize=4)
+        files = {}  # source -> its chunk documents
+        stored = {}  # source -> chunks upserted
+
+        def extract():
+            try:
+                for path in job.files:
+                    try:
+                        documents, busy, pause = self.throttle.run(self.stages["chunk_file"], path)
+                        job.stage_seconds["extract"] += busy
+                        job.stage_seconds["throttled"] += pause
+                        if not documents:
+                            job.errors.append(f"No text extracted from {path}")
+                        else:
+                            files[documents[0]['source']] = documents
+                            job.chunks_total += len(documents)
+                            for doc in documents:
+                                chunks_q.put(doc)
+                    except Exception as e:
+                        job.errors.append(f"{path}: {e}")
+                    job.files_done += 1
+                    self._save(job, min_interval=1.0)
+            finally:
+                chunks_q.put(_DONE)
+
+        def embed():
+            batch = []
+            try:
+                while True:
+                    doc = chunks_q.get()
+                    if doc is not _DONE:
+                        batch.append(doc)
+                    if batch and (doc is _DONE or len(batch) >= self.embed_batch):
+                        try:
+                            embeddings, busy, pause = self.throttle.run(self.stages["embed"], [d['text'] for d in batch])
+                            job.stage_seconds["embed"] += busy
+                            job.stage_seconds["throttled"] += pause
+                            start = job.chunks_embedded
+                            points = [self.stages["make_point"](d, start + i, e, ingested_at)
+                                      for i, (d, e) in enumerate(zip(batch, embeddings))]
+                            job.chunks_embedded += len(batch)
+                            points_q.put((batch, points))
+                        except Exception as e:
+                            job.errors.append(f"Embedding failed: {e}")
+                        batch = []
+                    if doc is _DONE:
+                        break
+            finally:
+                points_q.put(_DONE)
+
+        def upsert():
+            while True:
+                item = points_q.get()
+                if item is _DONE:
+                    break
+                docs, points = item
+                for i in range(0, len(points), self.upsert_batch):
+                    batch = points[i:i + self.upsert_batch]
+                    start = time.monotonic()
+                    try:
+                        self.stages["upsert"](batch)
+                        job.chunks_upserted += len(batch)
+                        for doc in docs[i:i + self.upsert_batch]:
+                            stored[doc['source']] = stored.get(doc['source'], 0) + 1
+                    except Exception as e:
+                        job.errors.append(f"Upsert failed: {e}")
+                    job.stage_seconds["upsert"] += time.monotonic() - start
+                    self._save(job, min_interval=1.0)
+
+        threads = [threading.Thread(target=fn, name=f"ingest-{fn.__name__}", daemon=True)
+                   for fn in (extract, embed, upsert)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # A file replaces its previous version only when every one of its new chunks is stored,
+        # otherwise the chunks this job did store are rolled back
+        for source, documents in files.items():
+            count = stored.get(source, 0)
+            if count == len(documents):
+                try:
+                    self.stages["finish_file"](documents, ingested_at)
+                    job.files_ingested += 1
+                except Exception as e:
+                    job.errors.append(f"{source}: {e}")
+                continue
+            try:
+                if count:
+                    self.stages["discard_file"](documents, ingested_at)
+                job.errors.append(f"{source}: {count}/{len(documents)} chunks stored, kept the previous version")
+            except Exception as e:
+                job.errors.append(f"{source}: {count}/{len(documents)} chunks stored and rolling them back failed, "
+                                  f"the file mixes two versions until it is ingested again: {e}")
+
+
+def default_stages():
+    """Stage functions backed by upload_enhanced (imported lazily: PDF/DOCX parsers, Qdrant client)"""
+    import upload_enhanced
+    from rag_module import client, QDRANT_COLLECTION
+
+    return {
+        "prepare": lambda: (upload_enhanced.ensure_collection(), upload_enhanced.create_payload_indexes()),
+        "chunk_file": upload_enhanced.chunk_file,
+        "finish_file": upload_enhanced.finish_file,
+        "discard_file": upload_enhanced.discard_file,
+        "embed": lambda texts: upload_enhanced.get_embedding_model().encode(texts, batch_size=len(texts)),
+        "make_point": upload_enhanced.make_point,
+        "upsert": lambda points: client.upsert(collection_name=QDRANT_COLLECTION, points=points),
+    }
+
+
+def resolve_paths(paths, allowed_roots):
+    """Expand files and folders into supported files, refusing anything outside allowed_roots"""
+    from upload_enhanced import SUPPORTED_EXTENSIONS, find_documents
+
+    roots = [Path(root).resolve() for root in allowed_roots]
+    files = []
+    for raw in paths:
+        path = Path(raw).resolve()
+        if not any(path == root or root in path.parents for root in roots):
+            raise ValueError(f"Path is outside the allowed ingestion roots: {raw}")
+        if path.is_dir():
+            files.extend(find_documents(path))
+        elif path.is_file() and path.suffix.lower() in SUPPORTED_EXTENSIONS:
+            files.append(path)
+        else:
+            raise ValueError(f"Not a supported file or folder: {raw}")
+    return files
+
+
+ingest_queue = None
+job_store = None
+_queue_lock = threading.Lock()
+
+
+def get_job_store():
+    """Process-wide handle on the shared job store, created on first use"""
+    global job_store
+    if job_store is None:
+        job_store = JobStore(INGEST_JOB_STORE_PATH)
+    return job_store
+
+
+def get_job_progress(job_id):
+    """
+    Progress of a job accepted by any worker. Without a local queue it is read
+    straight from the job store, so a status poll never loads the ingestion stages.
+    """
+    if ingest_queue is not None:
+        return ingest_queue.progress(job_id)
+    return get_job_store().load(job_id)
+
+
+def get_ingest_queue(on_job_done=None):
+    """Process-wide ingestion queue, created on first use"""
+    global ingest_queue
+    with _queue_lock:
+        if ingest_queue is None:
+            ingest_queue = IngestQueue(
+                default_stages(),
+                max_queued=INGEST_MAX_QUEUED_JOBS,
+                cpu_share=INGEST_CPU_SHARE,
+                embed_batch=INGEST_EMBED_BATCH,
+                upsert_batch=INGEST_UPSERT_BATCH,
+                on_job_done=on_job_done,
+                store=get_job_store(),
+            )
+    return ingest_queue
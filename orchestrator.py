@@ -1,7 +1,20 @@
 import google.generativeai as genai
-from rag_module import retrieve_similar_docs
+from rag_module import retrieve_similar_docs, expand_to_parents, chunk_store, stitch_chunks
 from search_module import serpapi_search
-from config import GEMINI_API_KEY, PRIORITY_LINKS
+from results_module import dedupe, pack_context, SOURCE_DOCS, SOURCE_WEB
+from prompt_module import PromptBuilder, PrefixCachingModel, create_gemini_cached_model
+from routing_module import ModelRouter, ModelTier, FINISH_SAFETY
+from policy_module import build_policy, load_calibration
+from resilience_module import Deadline, BREAKERS, guarded_call, call_timeout
+from config import (
+    GEMINI_API_KEY, PRIORITY_LINKS, GEMINI_FAST_MODEL, GEMINI_PRO_MODEL, GEMINI_FAST_COST, GEMINI_PRO_COST,
+    ROUTER_LATENCY_SLO_MS, ROUTER_MIN_FAST_SCORE, ROUTER_MAX_FAST_WORDS,
+    REQUEST_BUDGET_SECONDS, SERPAPI_BUDGET_SECONDS, GEMINI_MIN_BUDGET_SECONDS,
+    HOT_DOCUMENTS, CONTEXT_CACHE_ENABLED, DOC_CONTEXT_SHARE, CONTEXT_CACHE_TTL_SECONDS,
+    ADAPTIVE_RETRIEVAL_ENABLED, RETRIEVAL_CALIBRATION_PATH, RETRIEVAL_TOP_K, RETRIEVAL_MAX_TOP_K,
+    RETRIEVAL_CONFIDENT_SCORE, RETRIEVAL_FLAT_SPREAD, EMBEDDING_MODEL_NAME
+)
+from dataclasses import dataclass, field
 import logging
 import json
 
@@ -38,120 +51,148 @@ safety_settings = [
     }
 ]
 
-model = genai.GenerativeModel("gemini-2.5-pro", safety_settings=safety_settings)
+MAX_CONTEXT_CHARS = 4000  # Conservative limit
+# Document and web scores are on different scales, so each source gets its own share of the context
+CONTEXT_SHARES = {SOURCE_DOCS: DOC_CONTEXT_SHARE, SOURCE_WEB: 1 - DOC_CONTEXT_SHARE}
+
+def load_hot_documents():
+    """Full text of the HOT_DOCUMENTS files by source path, rebuilt from the chunk store"""
+    documents = {}
+    for filename in HOT_DOCUMENTS:
+        sources = chunk_store.find_sources(filename)
+        if not sources:
+            logger.warning(f"Hot document {filename} not found in the chunk store")
+            continue
+        if len(sources) > 1:
+            logger.warning(f"Hot document {filename} exists at {sources}; using {sources[0]}")
+        chunks = chunk_store.get_range(sources[0], 0, 1_000_000)
+        documents[sources[0]] = stitch_chunks([chunks[i] for i in sorted(chunks)])
+    return documents
+
+prompt_builder = PromptBuilder(load_hot_documents)
+
+def caching_model(model_name):
+    """Gemini model that reuses the stable prompt prefix via context caching"""
+    return PrefixCachingModel(
+        model_name,
+        genai.GenerativeModel(model_name, safety_settings=safety_settings),
+        lambda name, prompt: create_gemini_cached_model(name, prompt, safety_settings, CONTEXT_CACHE_TTL_SECONDS),
+        ttl_seconds=CONTEXT_CACHE_TTL_SECONDS,
+        enabled=CONTEXT_CACHE_ENABLED
+    )
 
-def answer_query(query: str, priority_links=PRIORITY_LINKS):
+def gemini_request_options(deadline=None):
+    """Make the SDK's own HTTP call end when guarded_call stops waiting, so abandoned calls free their thread"""
+    return {"timeout": max(1.0, call_timeout("gemini", deadline))}
+
+router = ModelRouter(
+    fast=ModelTier("fast", caching_model(GEMINI_FAST_MODEL), *GEMINI_FAST_COST),
+    pro=ModelTier("pro", caching_model(GEMINI_PRO_MODEL), *GEMINI_PRO_COST),
+    latency_slo_ms=ROUTER_LATENCY_SLO_MS,
+    min_fast_score=ROUTER_MIN_FAST_SCORE,
+    max_fast_words=ROUTER_MAX_FAST_WORDS,
+    call=lambda fn, prompt, deadline=None: guarded_call("gemini", fn, prompt, deadline=deadline,
+                                                     request_options=gemini_request_options(deadline))
+)
+
+retrieval_policy = build_policy(
+    ADAPTIVE_RETRIEVAL_ENABLED,
+    load_calibration(RETRIEVAL_CALIBRATION_PATH, EMBEDDING_MODEL_NAME, RETRIEVAL_TOP_K, RETRIEVAL_MAX_TOP_K),
+    base_k=RETRIEVAL_TOP_K,
+    max_k=RETRIEVAL_MAX_TOP_K,
+    confident_score=float(RETRIEVAL_CONFIDENT_SCORE) if RETRIEVAL_CONFIDENT_SCORE else None,
+    flat_spread=float(RETRIEVAL_FLAT_SPREAD) if RETRIEVAL_FLAT_SPREAD else None
+)
+
+@dataclass
+class Answer:
+    """Generated answer plus the retrieved results it was grounded on"""
+    text: str
+    citations: list = field(default_factory=list)
+    tier: str = None  # model tier that answered, None for canned/fallback answers
+
+def context_fallback(context_parts):
+    """Context-only answer used when Gemini fails, is tripped, or there is no budget left for it"""
+    if context_parts:
+        logger.info("Generating fallback response from context")
+        fallback = f"Based on the available information:\n\n"
+        
+        # Include the most relevant context
+        for i, part in enumerate(context_parts[:3]):  # Top 3 most relevant
+            fallback += f"{part[:200]}...\n\n"
+        
+        fallback += f"Please note: The AI service encountered an issue, so this is a basic response from the retrieved information."
+        return fallback
+    else:
+        return "I apologize, but I encountered an error and couldn't retrieve relevant information for your question. Please try again."
+
+def answer_query(query: str, priority_links=PRIORITY_LINKS, doc_filter=None):
+    return answer_query_detailed(query, priority_links, doc_filter).text
+
+def answer_query_detailed(query: str, priority_links=PRIORITY_LINKS, doc_filter=None) -> Answer:
     logger.info(f"Starting query processing for: '{query}'")
+    deadline = Deadline(REQUEST_BUDGET_SECONDS)
     
     try:
-        # 1. Web/Priority search
-        logger.info("Step 1: Starting SerpAPI search...")
-        serp_results = serpapi_search(query, priority_links)
-        logger.info(f"SerpAPI search completed. Found {len(serp_results)} results")
+        # 1. RAG search: one search wide enough for the policy, expanded only for the hits we keep
+        logger.info("Step 1: Starting RAG document retrieval...")
+        hits = retrieve_similar_docs(query, top_k=retrieval_policy.search_k, deadline=deadline,
+                                     doc_filter=doc_filter, expand=False)
+        decision = retrieval_policy.decide([hit.score for hit in hits])
+        doc_results = expand_to_parents(hits[:decision.top_k], deadline=deadline)
+        logger.info(f"RAG search completed. Found {len(doc_results)} documents")
         
-        # 2. RAG search
-        logger.info("Step 2: Starting RAG document retrieval...")
-        doc_context = retrieve_similar_docs(query)
-        logger.info(f"RAG search completed. Found {len(doc_context)} documents")
+        # 2. Web/Priority search, skipped when the documents already answer confidently
+        serp_results = []
+        if decision.search_web:
+            logger.info("Step 2: Starting SerpAPI search...")
+            serp_results = serpapi_search(query, priority_links, deadline=deadline.sub(SERPAPI_BUDGET_SECONDS))
+            logger.info(f"SerpAPI search completed. Found {len(serp_results)} results")
+        else:
+            logger.info(f"Step 2: Skipping SerpAPI search (top document score {decision.top_score:.3f})")
         
         # 3. Build context with length limits
         logger.info("Step 3: Building context for Gemini...")
-        all_context = serp_results + doc_context
-        
-        # Limit context length to avoid token limits
-        context_parts = []
-        total_length = 0
-        max_context_length = 4000  # Conservative limit
+        packed, context_parts = pack_context(dedupe(serp_results + doc_results), MAX_CONTEXT_CHARS,
+                                             shares=CONTEXT_SHARES)
+        citations = [result.citation(i + 1) for i, result in enumerate(packed)]
         
-        for item in all_context:
-            if total_length + len(item) < max_context_length:
-                context_parts.append(item)
-                total_length += len(item)
-            else:
-                # Truncate the last item if needed
-                remaining = max_context_length - total_length
-                if remaining > 100:  # Only add if meaningful length remains
-                    context_parts.append(item[:remaining] + "...")
-                break
+        # Stable instructions and hot documents first, then this query's context and question
+        prompt = prompt_builder.build(query, packed, context_parts)
         
-        context = "\n\n".join(context_parts)
-        
-        logger.info(f"Context length: {len(context)} characters from {len(context_parts)} sources")
-        
-        # Build a more structured prompt
-        prompt = f"""You are a helpful AI assistant specializing in digital marketing and Facebook advertising.
-
-Based on the following context information, provide a clear and helpful answer to the user's question.
-
-CONTEXT:
-{context}
-
-USER QUESTION: {query}
-
-INSTRUCTIONS:
-- Provide a comprehensive but concise answer
-- Use information from the context when relevant
-- If the context doesn't fully answer the question, acknowledge that
-- Keep your response professional and helpful
-
-ANSWER:"""
-        
-        logger.info(f"Prompt length: {len(prompt)} characters")
+        logger.info(f"Prompt length: {len(prompt.prefix)} prefix + {len(prompt.delta)} delta characters "
+                    f"from {len(context_parts)} sources")
         
         # 4. Generate response with error handling
         logger.info("Step 4: Generating Gemini response...")
         
+        if BREAKERS["gemini"].is_open():
+            logger.warning("Gemini circuit is open, degrading to context-only answer")
+            return Answer(context_fallback(context_parts), citations)
+        if deadline.remaining() < GEMINI_MIN_BUDGET_SECONDS:
+            logger.warning(f"Only {deadline.remaining():.2f}s of budget left, degrading to context-only answer")
+            return Answer(context_fallback(context_parts), citations)
+        
         try:
-            response = model.generate_content(prompt)
-            logger.info("Gemini response generated successfully")
+            routed = router.generate(prompt, query, [result.score for result in doc_results], deadline=deadline)
+            logger.info(f"Gemini response generated by '{routed.tier}' tier "
+                        f"(escalated={routed.escalated}, {routed.latency_ms:.0f}ms)")
             
-            # Debug response
-            if hasattr(response, 'candidates') and response.candidates:
-                candidate = response.candidates[0]
-                logger.info(f"Response finish_reason: {candidate.finish_reason}")
-                
-                # finish_reason values: 1=STOP, 2=MAX_TOKENS, 3=SAFETY, 4=RECITATION, 5=OTHER
-                if candidate.finish_reason == 3:  # SAFETY
-                    logger.warning("Response blocked by safety filters")
-                    return "I apologize, but I cannot provide a response to this query due to safety considerations. Please try rephrasing your question."
-                elif candidate.finish_reason == 2:  # MAX_TOKENS
-                    logger.warning("Response truncated due to token limit")
-                elif candidate.finish_reason != 1:  # Not STOP
-                    logger.warning(f"Unexpected finish_reason: {candidate.finish_reason}")
+            if routed.finish_reason == FINISH_SAFETY:
+                logger.warning("Response blocked by safety filters")
+                return Answer("I apologize, but I cannot provide a response to this query due to safety considerations. Please try rephrasing your question.")
             
-            # Extract response text
-            if hasattr(response, 'text') and response.text:
-                logger.info(f"Response text length: {len(response.text)} characters")
-                return response.text
-            else:
-                # Try to extract from candidates manually
-                if hasattr(response, 'candidates') and response.candidates:
-                    for candidate in response.candidates:
-                        if hasattr(candidate, 'content') and candidate.content and candidate.content.parts:
-                            for part in candidate.content.parts:
-                                if hasattr(part, 'text') and part.text:
-                                    logger.info("Extracted text from candidate parts")
-                                    return part.text
-                
-                logger.error("No valid text found in response")
-                return "I apologize, but I couldn't generate a proper response. Please try rephrasing your question."
+            if routed.text:
+                logger.info(f"Response text length: {len(routed.text)} characters")
+                return Answer(routed.text, citations, routed.tier)
+            
+            logger.error("No valid text found in response")
+            return Answer("I apologize, but I couldn't generate a proper response. Please try rephrasing your question.")
                 
         except Exception as gemini_error:
             logger.error(f"Gemini API error: {str(gemini_error)}")
             
-            # Fallback response using context
-            if context_parts:
-                logger.info("Generating fallback response from context")
-                fallback = f"Based on the available information:\n\n"
-                
-                # Include the most relevant context
-                for i, part in enumerate(context_parts[:3]):  # Top 3 most relevant
-                    fallback += f"{part[:200]}...\n\n"
-                
-                fallback += f"Please note: The AI service encountered an issue, so this is a basic response from the retrieved information."
-                return fallback
-            else:
-                return "I apologize, but I encountered an error and couldn't retrieve relevant information for your question. Please try again."
+            return Answer(context_fallback(context_parts), citations)
     
     except Exception as e:
         logger.error(f"Error in answer_query: {str(e)}")
@@ -0,0 +1,171 @@
+"""
+Adaptive retrieval policy.
+Document retrieval runs first; its scores decide how much more work a query needs:
+a confident top hit answers from our documents alone and skips the SerpAPI round
+trips, flat scores (no chunk clearly better than the rest) widen top_k and keep the
+web search as a fallback. Thresholds are calibrated on the labeled questions with
+`python eval_retrieval.py --build --calibrate --write-calibration`, which saves them
+for the current embedding model; without a calibration (or explicit thresholds in
+config) the policy stays disabled: always search the web with the base top_k.
+"""
+
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DECISION_CONFIDENT = "confident"  # strong top hit: documents only, no web search
+DECISION_FLAT = "flat"  # no clear winner: widen top_k and search the web
+DECISION_DEFAULT = "default"  # base top_k plus web search, as before the policy
+DECISION_NO_DOCS = "no_docs"  # retrieval returned nothing (empty index, filter, Qdrant down)
+DECISION_DISABLED = "disabled"
+
+
+@dataclass
+class RetrievalDecision:
+    kind: str
+    top_k: int  # how many of the retrieved chunks to keep
+    search_web: bool
+    top_score: float = None
+    spread: float = None  # top score minus the score at the base top_k
+
+
+class RetrievalPolicy:
+    """
+    Decides from the sorted chunk scores of one search (up to max_k hits) whether
+    to keep base_k or max_k of them and whether the web search is still needed.
+    A threshold left as None never triggers its decision.
+    """
+
+    def __init__(self, base_k=3, max_k=8, confident_score=None, flat_spread=None, enabled=True):
+        self.base_k = base_k
+        self.max_k = max(base_k, max_k)
+        self.confident_score = confident_score
+        self.flat_spread = flat_spread
+        self.enabled = enabled
+        self.counts = {kind: 0 for kind in (DECISION_CONFIDENT, DECISION_FLAT, DECISION_DEFAULT,
+                                            DECISION_NO_DOCS, DECISION_DISABLED)}
+        self._lock = threading.Lock()
+
+    @property
+    def search_k(self):
+        """How many chunks to ask Qdrant for, so widening top_k never needs a second search"""
+        return self.max_k if self.enabled else self.base_k
+
+    def decide(self, scores):
+        scores = sorted(scores, reverse=True)
+        if not self.enabled:
+            decision = RetrievalDecision(DECISION_DISABLED, self.base_k, True)
+        elif not scores:
+            decision = RetrievalDecision(DECISION_NO_DOCS, self.base_k, True)
+        else:
+            top = scores[0]
+            spread = top - scores[min(self.base_k, len(scores)) - 1]
+            if self.confident_score is not None and top >= self.confident_score:
+                decision = RetrievalDecision(DECISION_CONFIDENT, self.base_k, False, top, spread)
+            elif self.flat_spread is not None and len(scores) > 1 and spread < self.flat_spread:
+                decision = RetrievalDecision(DECISION_FLAT, self.max_k, True, top, spread)
+            else:
+                decision = RetrievalDecision(DECISION_DEFAULT, self.base_k, True, top, spread)
+
+        with self._lock:
+            self.counts[decision.kind] += 1
+        logger.info(f"Retrieval decision '{decision.kind}': top_k={decision.top_k}, web={decision.search_web}, "
+                    f"top={decision.top_score}, spread={decision.spread}")
+        return decision
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        return {
+            "enabled": self.enabled,
+            "base_k": self.base_k,
+            "max_k": self.max_k,
+            "confident_score": self.confident_score,
+            "flat_spread": self.flat_spread,
+            "decisions": counts,
+            "web_searches_skipped": counts[DECISION_CONFIDENT],
+            "web_skip_rate": round(counts[DECISION_CONFIDENT] / total, 4) if total else None,
+        }
+
+
+def calibrate(samples, base_k=3, target_precision=0.9, min_support=3):
+    """
+    Suggest thresholds from labeled samples: (sorted scores, top hit relevant, relevant within base_k).
+    confident_score is the lowest top score above which the top hit is right at least
+    target_precision of the time; flat_spread best separates the remaining misses
+    (no relevant hit in base_k) from hits. Either is None when the data cannot support it.
+    """
+    samples = [(sorted(scores, reverse=True), top_ok, base_ok) for scores, top_ok, base_ok in samples if scores]
+
+    confident_score, precision, coverage = None, None, 0.0
+    for threshold in sorted({scores[0] for scores, _, _ in samples}, reverse=True):
+        above = [top_ok for scores, top_ok, _ in samples if scores[0] >= threshold]
+        if len(above) >= min_support and sum(above) / len(above) >= target_precision:
+            confident_score = threshold
+            precision = sum(above) / len(above)
+            coverage = len(above) / len(samples)
+
+    rest = [(scores[0] - scores[min(base_k, len(scores)) - 1], base_ok) for scores, _, base_ok in samples
+            if confident_score is None or scores[0] < confident_score]
+    flat_spread, best_gain = None, 0
+    spreads = sorted({spread for spread, _ in rest})
+    # Cut halfway between observed spreads so the threshold does not sit on a sample
+    for low, high in zip(spreads, spreads[1:] + [spreads[-1] + 0.02] if spreads else []):
+        candidate = round((low + high) / 2, 4)
+        gain = sum(1 if not ok else -1 for s, ok in rest if s < candidate)
+        if gain > best_gain:
+            flat_spread, best_gain = candidate, gain
+
+    return {
+        "confident_score": round(confident_score, 4) if confident_score is not None else None,
+        "confident_precision": round(precision, 4) if precision is not None else None,
+        "web_skip_rate": round(coverage, 4),
+        "flat_spread": flat_spread,
+        "samples": len(samples),
+    }
+
+
+def load_calibration(path, model, base_k, max_k):
+    """
+    Thresholds saved by `eval_retrieval.py --calibrate --write-calibration`, or None
+    when there is no file or it was calibrated for another embedding model or top_k
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            calibration = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read retrieval calibration {path}: {e}")
+        return None
+    expected = {"model": model, "base_k": base_k, "max_k": max_k}
+    mismatched = {key: calibration.get(key) for key, value in expected.items() if calibration.get(key) != value}
+    if mismatched:
+        logger.warning(f"Ignoring retrieval calibration {path}: calibrated for {mismatched}, running with {expected}")
+        return None
+    return calibration
+
+
+def build_policy(mode, calibration, base_k, max_k, confident_score=None, flat_spread=None):
+    """
+    Policy for ADAPTIVE_RETRIEVAL_ENABLED (auto, true or false). Explicit thresholds
+    override the calibrated ones; with neither, the policy is disabled.
+    """
+    calibration = calibration or {}
+    if confident_score is None:
+        confident_score = calibration.get("confident_score")
+    if flat_spread is None:
+        flat_spread = calibration.get("flat_spread")
+    calibrated = confident_score is not None or flat_spread is not None
+    if mode == "true" and not calibrated:
+        logger.error("ADAPTIVE_RETRIEVAL_ENABLED is true but no thresholds are calibrated or set; policy disabled")
+    enabled = mode != "false" and calibrated
+    logger.info(f"Adaptive retrieval {'enabled' if enabled else 'disabled'} (mode={mode}, "
+                f"confident_score={confident_score}, flat_spread={flat_spread})")
+    return RetrievalPolicy(base_k, max_k, confident_score, flat_spread, enabled)
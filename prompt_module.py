@@ -0,0 +1,202 @@
+"""
+Prompt construction with a stable, reusable prefix.
+The system instructions and the hot reference documents always come first and
+in the same order, so they can be stored once with Gemini's cached-content
+feature; each request then sends only its own context and question. Without a
+cached prefix the hot documents are left out and the plain prompt is sent.
+"""
+
+import datetime
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SYSTEM_INSTRUCTIONS = """You are a helpful AI assistant specializing in digital marketing and Facebook advertising.
+
+Based on the context information you are given, provide a clear and helpful answer to the user's question.
+
+INSTRUCTIONS:
+- Provide a comprehensive but concise answer
+- Use information from the context when relevant and cite it by number, e.g. [1]
+- If the context doesn't fully answer the question, acknowledge that
+- Keep your response professional and helpful"""
+
+
+@dataclass
+class BuiltPrompt:
+    """A prompt split into a long-lived prefix and the per-query delta, plus its plain form"""
+    prefix_key: str
+    system_instruction: str
+    reference_text: str  # hot documents, "" when there are none
+    delta: str  # context where hot document hits point at the prefix
+    inline_delta: str  # the same context with every passage written out
+
+    @property
+    def prefix(self):
+        if self.reference_text:
+            return f"{self.system_instruction}\n\nREFERENCE DOCUMENTS:\n{self.reference_text}"
+        return self.system_instruction
+
+    @property
+    def text(self):
+        """The plain prompt for models without a cached prefix: no hot documents, no pointers"""
+        return f"{self.system_instruction}\n\n{self.inline_delta}"
+
+    def __str__(self):
+        return self.text
+
+    def __len__(self):
+        return len(self.text)
+
+
+class PromptBuilder:
+    """Builds BuiltPrompts; hot documents are loaded lazily from load_hot_documents() -> {source path: text}"""
+
+    def __init__(self, load_hot_documents=None, system_instruction=SYSTEM_INSTRUCTIONS):
+        self.load_hot_documents = load_hot_documents or (lambda: {})
+        self.system_instruction = system_instruction
+        self._hot_documents = None
+        self._reference_text = ""
+        self._prefix_key = None
+        self._lock = threading.Lock()
+
+    def refresh_hot_documents(self):
+        """Reload the hot documents (e.g. after ingestion); changes the prefix key if their text changed"""
+        try:
+            documents = self.load_hot_documents()
+        except Exception as e:
+            logger.warning(f"Could not load hot documents: {e}")
+            documents = {}
+        # Sorted so the prefix is byte-identical across workers and restarts
+        reference_text = "\n\n".join(f"[{name}]\n{text}" for name, text in sorted(documents.items()))
+        prefix_key = hashlib.sha1(f"{self.system_instruction}\0{reference_text}".encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            self._hot_documents = documents
+            self._reference_text = reference_text
+            self._prefix_key = prefix_key
+        logger.info(f"Prompt prefix {prefix_key}: {len(documents)} hot document(s), {len(reference_text)} characters")
+
+    def build(self, query, packed, context_parts):
+        """Prompt for one query; packed results from hot documents point at the prefix instead of repeating text"""
+        if self._hot_documents is None:
+            self.refresh_hot_documents()
+        hot = self._hot_documents
+
+        lines, inline_lines = [], []
+        for i, (result, part) in enumerate(zip(packed, context_parts)):
+            source_path = (result.metadata or {}).get("source_path")
+            if source_path in hot:
+                lines.append(f"[{i + 1}] See reference document [{source_path}] above.")
+            else:
+                lines.append(f"[{i + 1}] {part}")
+            inline_lines.append(f"[{i + 1}] {part}")
+
+        return BuiltPrompt(self._prefix_key, self.system_instruction, self._reference_text,
+                           self._delta(query, lines), self._delta(query, inline_lines))
+
+    @staticmethod
+    def _delta(query, lines):
+        context = "\n\n".join(lines)
+        return f"""CONTEXT:
+{context}
+
+USER QUESTION: {query}
+
+ANSWER:"""
+
+
+def create_gemini_cached_model(model_name, prompt, safety_settings, ttl_seconds):
+    """Store the prompt prefix as Gemini cached content; returns (model bound to it, expiry time)"""
+    import google.generativeai as genai
+    from google.generativeai import caching
+
+    contents = [prompt.reference_text] if prompt.reference_text else []
+    cached = caching.CachedContent.create(
+        model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+        display_name=f"websearch_rag-{prompt.prefix_key}",
+        system_instruction=prompt.system_instruction,
+        contents=contents,
+        ttl=datetime.timedelta(seconds=ttl_seconds),
+    )
+    model = genai.GenerativeModel.from_cached_content(cached_content=cached, safety_settings=safety_settings)
+    return model, time.time() + ttl_seconds
+
+
+class PrefixCachingModel:
+    """
+    Wraps a model so BuiltPrompts reuse a cached prefix: the prefix is uploaded once per
+    (model, prefix key) and every request sends only the delta. Falls back to the plain
+    prompt, without hot documents, when caching is disabled or unavailable (old SDK, prefix
+    below the model's minimum cacheable size, API errors). Plain string prompts pass
+    straight through.
+    """
+
+    def __init__(self, model_name, model, create_cached_model, ttl_seconds=3600, enabled=True):
+        self.model_name = model_name
+        self.model = model
+        self.create_cached_model = create_cached_model
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._cached = {}  # prefix_key -> (model, expires_at)
+        self._unsupported = set()  # prefix keys that could not be cached
+        self.requests = 0
+        self.prefix_hits = 0
+        self.prefix_creations = 0
+        self.inline_requests = 0
+        self.sent_chars = 0
+        self.saved_chars = 0
+        self._lock = threading.Lock()
+
+    def _cached_model(self, prompt):
+        if not self.enabled or prompt.prefix_key in self._unsupported:
+            return None
+        with self._lock:
+            entry = self._cached.get(prompt.prefix_key)
+            # Renew a little before the server-side TTL runs out
+            if entry and entry[1] - time.time() > 60:
+                self.prefix_hits += 1
+                return entry[0]
+            try:
+                model, expires_at = self.create_cached_model(self.model_name, prompt)
+            except Exception as e:
+                logger.warning(f"Context caching unavailable for {self.model_name} prefix {prompt.prefix_key}: {e}")
+                self._unsupported.add(prompt.prefix_key)
+                return None
+            self._cached = {prompt.prefix_key: (model, expires_at)}
+            self.prefix_creations += 1
+            logger.info(f"Cached prompt prefix {prompt.prefix_key} for {self.model_name}")
+            return model
+
+    def generate_content(self, prompt, **kwargs):
+        if not isinstance(prompt, BuiltPrompt):
+            return self.model.generate_content(prompt, **kwargs)
+
+        cached_model = self._cached_model(prompt)
+        with self._lock:
+            self.requests += 1
+            if cached_model is not None:
+                self.sent_chars += len(prompt.delta)
+                self.saved_chars += len(prompt.prefix)
+            else:
+                self.inline_requests += 1
+                self.sent_chars += len(prompt.text)
+        if cached_model is not None:
+            return cached_model.generate_content(prompt.delta, **kwargs)
+        return self.model.generate_content(prompt.text, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "prefix_hits": self.prefix_hits,
+                "prefix_creations": self.prefix_creations,
+                "inline_requests": self.inline_requests,
+                "prefix_hit_rate": round(self.prefix_hits / self.requests, 4) if self.requests else None,
+                "sent_chars": self.sent_chars,
+                "saved_chars": self.saved_chars,
+            }
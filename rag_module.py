@@ -1,7 +1,15 @@
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 import google.generativeai as genai
-from config import QDRANT_URL, QDRANT_API_KEY, QDRANT_HOST, QDRANT_PORT
+from config import (
+    QDRANT_URL, QDRANT_API_KEY, QDRANT_HOST, QDRANT_PORT, QDRANT_PATH, QDRANT_TIMEOUT_SECONDS,
+    EMBED_CHUNK_CHARS, CHUNK_OVERLAP_CHARS, PARENT_CONTEXT_CHARS, CHUNK_STORE_PATH
+)
+from resilience_module import guarded_call
+from embedding_module import get_embedding_model, embed_query
+from results_module import RetrievedDoc, SOURCE_DOCS
+from chunk_store import ChunkStore
+from dataclasses import dataclass, field
 import logging
 
 # Configure logging
@@ -9,13 +17,51 @@ logger = logging.getLogger(__name__)
 
 QDRANT_COLLECTION = "DM_docs"
 
-# Connect to Qdrant Cloud if URL and API key are provided, otherwise use localhost
-if QDRANT_URL and QDRANT_API_KEY:
-    client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-    logger.info(f"Connected to Qdrant Cloud: {QDRANT_URL}")
-else:
-    client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+# Payload fields that retrieval can filter on; upload_enhanced creates an index for each
+KEYWORD_INDEX_FIELDS = ("file_type", "filename", "source")
+INTEGER_INDEX_FIELDS = ("ingested_at", "chunk_id")
+
+def create_qdrant_client():
+    """
+    Qdrant Cloud if URL and API key are provided, an embedded on-disk index if
+    QDRANT_PATH is set, otherwise a Qdrant server on QDRANT_HOST:QDRANT_PORT
+    """
+    if QDRANT_URL and QDRANT_API_KEY:
+        logger.info(f"Connected to Qdrant Cloud: {QDRANT_URL}")
+        return QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=max(1, int(QDRANT_TIMEOUT_SECONDS)))
+    if QDRANT_PATH:
+        logger.info(f"Using embedded local Qdrant index: {QDRANT_PATH}")
+        return QdrantClient(path=QDRANT_PATH)
     logger.info(f"Connected to local Qdrant: {QDRANT_HOST}:{QDRANT_PORT}")
+    return QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT, timeout=max(1, int(QDRANT_TIMEOUT_SECONDS)))
+
+client = create_qdrant_client()
+chunk_store = ChunkStore(CHUNK_STORE_PATH)
+
+@dataclass
+class DocFilter:
+    """Restricts document retrieval by payload fields; empty fields do not filter"""
+    file_types: list = field(default_factory=list)  # e.g. [".md", "pdf"]
+    filenames: list = field(default_factory=list)
+    sources: list = field(default_factory=list)  # normalized source paths, see upload_enhanced.source_path
+    ingested_after: int = None  # unix timestamp
+    ingested_before: int = None
+
+    def to_qdrant(self):
+        conditions = []
+        if self.file_types:
+            file_types = [ft.lower() if ft.startswith(".") else f".{ft.lower()}" for ft in self.file_types]
+            conditions.append(models.FieldCondition(key="file_type", match=models.MatchAny(any=file_types)))
+        if self.filenames:
+            conditions.append(models.FieldCondition(key="filename", match=models.MatchAny(any=list(self.filenames))))
+        if self.sources:
+            conditions.append(models.FieldCondition(key="source", match=models.MatchAny(any=list(self.sources))))
+        if self.ingested_after is not None or self.ingested_before is not None:
+            conditions.append(models.FieldCondition(
+                key="ingested_at",
+                range=models.Range(gte=self.ingested_after, lte=self.ingested_before)
+            ))
+        return models.Filter(must=conditions) if conditions else None
 
 def embed_text_with_gemini(text: str) -> list:
     # Gemini doesn't currently expose embeddings API publicly. Placeholder for embeddings.
@@ -23,49 +69,171 @@ def embed_text_with_gemini(text: str) -> list:
     logger.debug(f"Generating embedding for text: {text[:100]}...")
     
     try:
-        import sentence_transformers
-        model = sentence_transformers.SentenceTransformer("all-MiniLM-L6-v2")
-        embedding = model.encode([text])[0].tolist()
+        embedding = get_embedding_model().encode([text])[0].tolist()
         logger.debug(f"Generated embedding with {len(embedding)} dimensions")
         return embedding
     except Exception as e:
         logger.error(f"Error generating embedding: {e}")
         raise e
 
-def retrieve_similar_docs(query: str, top_k: int = 3):
-    logger.info(f"Retrieving similar documents for query: '{query}' (top_k={top_k})")
+def neighbor_window(chunk_id, total_chunks, max_chars=PARENT_CONTEXT_CHARS):
+    """Range of chunk ids around chunk_id whose stitched text is about max_chars long"""
+    step = max(1, EMBED_CHUNK_CHARS - CHUNK_OVERLAP_CHARS)
+    extra = max(0, (max_chars - EMBED_CHUNK_CHARS) // step)
+    first = max(0, chunk_id - extra // 2)
+    last = min(total_chunks - 1, first + extra)
+    first = max(0, last - extra)
+    return first, last
+
+def stitch_chunks(texts):
+    """Join consecutive chunks, removing the overlap chunk_text left between them"""
+    stitched = texts[0]
+    for text in texts[1:]:
+        for k in range(min(len(stitched), len(text), 2 * CHUNK_OVERLAP_CHARS), 10, -1):
+            if stitched.endswith(text[:k]):
+                stitched += text[k:]
+                break
+        else:
+            stitched += " " + text
+    return stitched
+
+def fetch_chunks(source, first, last, deadline=None, ingested_at=None):
+    """
+    {chunk_id: text} for a file's chunk range (by source path), from the local chunk
+    store or a Qdrant scroll. With ingested_at, only chunks of that version of the file
+    (while a re-upload is in progress Qdrant briefly holds two).
+    """
+    chunks = chunk_store.get_range(source, first, last, ingested_at)
+    if len(chunks) == last - first + 1:
+        return chunks
+
+    conditions = [
+        models.FieldCondition(key="source", match=models.MatchValue(value=source)),
+        models.FieldCondition(key="chunk_id", range=models.Range(gte=first, lte=last))
+    ]
+    if ingested_at is not None:
+        conditions.append(models.FieldCondition(key="ingested_at", match=models.MatchValue(value=ingested_at)))
+    try:
+        points, _ = guarded_call(
+            "qdrant",
+            client.scroll,
+            collection_name=QDRANT_COLLECTION,
+            scroll_filter=models.Filter(must=conditions),
+            limit=last - first + 1,
+            with_payload=["chunk_id", "text"],
+            with_vectors=False,
+            deadline=deadline
+        )
+        for point in points:
+            chunks.setdefault(point.payload["chunk_id"], point.payload["text"])
+    except Exception as e:
+        logger.warning(f"Could not fetch neighbor chunks for {source}: {e}")
+    return chunks
+
+def expand_to_parents(results, max_chars=PARENT_CONTEXT_CHARS, deadline=None):
+    """
+    Replace each matched chunk with the passage around it (its neighbor chunks).
+    Hits from the same version of a file whose windows touch are merged into one
+    passage, keeping the best score.
+    """
+    windows = []  # [first, last, best result] per passage
+    for result in sorted(results, key=lambda r: r.score, reverse=True):
+        meta = result.metadata or {}
+        if meta.get("total_chunks", 1) <= 1:
+            windows.append([None, None, result])
+            continue
+        first, last = neighbor_window(meta["chunk_id"], meta["total_chunks"], max_chars)
+        for window in windows:
+            best = window[2]
+            if (window[0] is not None and best.metadata.get("source_path") == meta.get("source_path")
+                    and best.metadata.get("ingested_at") == meta.get("ingested_at")
+                    and first <= window[1] + 1 and last >= window[0] - 1):
+                window[0], window[1] = min(window[0], first), max(window[1], last)
+                break
+        else:
+            windows.append([first, last, result])
+
+    expanded = []
+    for first, last, result in windows:
+        if first is None:
+            expanded.append(result)
+            continue
+        chunks = fetch_chunks(result.metadata.get("source_path", ""), first, last, deadline,
+                              result.metadata.get("ingested_at"))
+        chunks.setdefault(result.metadata["chunk_id"], result.text)
+        texts = [chunks[i] for i in range(first, last + 1) if i in chunks]
+        expanded.append(RetrievedDoc(
+            text=stitch_chunks(texts),
+            score=result.score,
+            source=result.source,
+            id=result.id,
+            title=result.title,
+            url=result.url,
+            metadata={**result.metadata, "chunk_range": [first, last]}
+        ))
+    logger.info(f"Expanded {len(results)} chunk(s) into {len(expanded)} passage(s)")
+    return expanded
+
+def retrieve_similar_docs(query: str, top_k: int = 3, deadline=None, doc_filter: DocFilter = None,
+                          expand: bool = True, raise_errors: bool = False) -> list[RetrievedDoc]:
+    """Documents most similar to the query; on failure an empty list, or the error with raise_errors"""
+    logger.info(f"Retrieving similar documents for query: '{query}' (top_k={top_k}, filter={doc_filter})")
     
     try:
         # Generate embedding for query
-        emb = embed_text_with_gemini(query)
+        emb = embed_query(query)
         logger.debug(f"Query embedding generated successfully")
         
         # Search in Qdrant
         logger.debug(f"Searching in collection: {QDRANT_COLLECTION}")
-        search_result = client.search(
+        search_result = guarded_call(
+            "qdrant",
+            client.query_points,
             collection_name=QDRANT_COLLECTION,
-            query_vector=emb,
-            limit=top_k
-        )
+            query=emb,
+            query_filter=doc_filter.to_qdrant() if doc_filter else None,
+            limit=top_k,
+            deadline=deadline
+        ).points
         
         logger.info(f"Found {len(search_result)} similar documents")
         
-        # Extract text from results
+        # Wrap hits in result records
         results = []
         for i, hit in enumerate(search_result):
-            score = hit.score
-            text = hit.payload["text"]
-            title = hit.payload.get("title", "Unknown")
-            filename = hit.payload.get("filename", "Unknown")
+            payload = hit.payload
+            title = payload.get("title", "Unknown")
+            filename = payload.get("filename", "Unknown")
             
-            logger.debug(f"Result {i+1}: score={score:.4f}, title='{title}', file='{filename}'")
-            results.append(text)
+            logger.debug(f"Result {i+1}: score={hit.score:.4f}, title='{title}', file='{filename}'")
+            results.append(RetrievedDoc(
+                text=payload["text"],
+                score=hit.score,
+                source=SOURCE_DOCS,
+                id=f"docs:{hit.id}",
+                title=title,
+                url=payload.get("source", ""),
+                metadata={
+                    "filename": filename,
+                    "source_path": payload.get("source", ""),
+                    "file_type": payload.get("file_type", ""),
+                    "chunk_id": payload.get("chunk_id", 0),
+                    "total_chunks": payload.get("total_chunks", 1),
+                    "ingested_at": payload.get("ingested_at")
+                }
+            ))
+        
+        # Search small chunks for precision, then read back the surrounding passage
+        if expand:
+            results = expand_to_parents(results, deadline=deadline)
         
-        logger.info(f"Returning {len(results)} document texts")
+        logger.info(f"Returning {len(results)} documents")
         return results
         
     except Exception as e:
         logger.error(f"Error in retrieve_similar_docs: {str(e)}")
         logger.error(f"Error type: {type(e)}")
+        if raise_errors:
+            raise
         # Return empty list instead of raising to prevent complete failure
         return []
@@ -0,0 +1,196 @@
+"""
+Latency budgets, per-dependency timeouts and circuit breakers for SerpAPI, Qdrant and Gemini.
+A tripped breaker fails fast instead of waiting for another slow error.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from config import (
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS, DEPENDENCY_THREADS,
+    SERPAPI_TIMEOUT_SECONDS, QDRANT_TIMEOUT_SECONDS, GEMINI_TIMEOUT_SECONDS
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the dependency's breaker is open"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call is rejected or abandoned because the request budget ran out"""
+
+
+class Deadline:
+    """Latency budget for one request"""
+
+    def __init__(self, budget_seconds):
+        self.budget = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0.0
+
+    def sub(self, budget_seconds):
+        """Child budget for one stage, never outliving this deadline"""
+        return Deadline(min(budget_seconds, self.remaining()))
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures; half-open after a cool-down lets one probe through"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, timeout, failure_threshold=5, reset_seconds=30.0):
+        self.name = name
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.trip_count = 0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.opened_at = None
+        self.last_error = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may proceed now"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    return False
+                self._probe_in_flight = True
+            self.calls += 1
+            return True
+
+    def is_open(self):
+        """True while the breaker would reject calls (does not count as a rejection)"""
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_seconds
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed after successful probe")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            if isinstance(error, (FutureTimeoutError, DeadlineExceeded)):
+                self.timeouts += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trip_count += 1
+                    logger.warning(f"Circuit '{self.name}' opened after {self.consecutive_failures} "
+                                   f"consecutive failure(s): {self.last_error}")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_abandoned(self):
+        """Caller gave up because its own budget ran out; not the dependency's fault"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def status(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "trip_count": self.trip_count,
+                "consecutive_failures": self.consecutive_failures,
+                "calls": self.calls,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+                "timeout_seconds": self.timeout,
+                "last_error": self.last_error,
+            }
+
+
+BREAKERS = {
+    "serpapi": CircuitBreaker("serpapi", SERPAPI_TIMEOUT_SECONDS, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS),
+    "qdrant": CircuitBreaker("qdrant", QDRANT_TIMEOUT_SECONDS, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS),
+    "gemini": CircuitBreaker("gemini", GEMINI_TIMEOUT_SECONDS, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS),
+}
+
+# Calls run on one pool per dependency so a hung dependency cannot block the request thread
+# past its timeout. An abandoned call keeps its thread until the client library gives up on its
+# own (callers pass the library a matching timeout), and only ever starves its own dependency.
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _executor(dependency):
+    with _executors_lock:
+        executor = _executors.get(dependency)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=DEPENDENCY_THREADS, thread_name_prefix=f"guarded-{dependency}")
+            _executors[dependency] = executor
+        return executor
+
+
+def call_timeout(dependency, deadline=None):
+    """Timeout for one call: the dependency's own, capped by what is left of the request budget"""
+    timeout = BREAKERS[dependency].timeout
+    if deadline is not None:
+        timeout = min(timeout, deadline.remaining())
+    return timeout
+
+
+def guarded_call(dependency, fn, *args, deadline=None, **kwargs):
+    """Run fn(*args, **kwargs) under the dependency's breaker and timeout, capped by the request deadline"""
+    breaker = BREAKERS[dependency]
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded(f"No latency budget left for {dependency}")
+    timeout = call_timeout(dependency, deadline)
+
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit for {dependency} is open")
+
+    future = _executor(dependency).submit(fn, *args, **kwargs)
+    try:
+        result = future.result(timeout=timeout)
+    except FutureTimeoutError as e:
+        future.cancel()
+        logger.warning(f"{dependency} call timed out after {timeout:.2f}s")
+        if timeout < breaker.timeout:
+            breaker.record_abandoned()
+        else:
+            breaker.record_failure(e)
+        raise DeadlineExceeded(f"{dependency} call timed out after {timeout:.2f}s") from e
+    except Exception as e:
+        breaker.record_failure(e)
+        raise
+    breaker.record_success()
+    return result
+
+
+def breaker_status():
+    """Snapshot of all breakers for the /debug endpoint"""
+    return {name: breaker.status() for name, breaker in BREAKERS.items()}
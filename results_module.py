@@ -0,0 +1,117 @@
+"""
+Structured retrieval results passed through the pipeline instead of bare strings.
+Web results and document chunks share one record type so they can be deduplicated,
+packed into the prompt and cited in the /ask response.
+"""
+
+import hashlib
+import logging
+from dataclasses import dataclass, asdict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SOURCE_WEB = "web"
+SOURCE_DOCS = "docs"
+
+
+@dataclass(slots=True)
+class RetrievedDoc:
+    """
+    One retrieved passage. `score` is in [0, 1] and ranks results of the same
+    source only: cosine similarity for document chunks, a position-based score for
+    web results (see search_module). The two scales are not comparable.
+    """
+    text: str
+    score: float
+    source: str  # SOURCE_WEB or SOURCE_DOCS
+    id: str
+    title: str = ""
+    url: str = ""  # result link for web results, file path for documents
+    metadata: dict = None
+
+    def citation(self, number):
+        return {
+            "number": number,
+            "id": self.id,
+            "title": self.title,
+            "source": self.source,
+            "url": self.url,
+            "score": round(self.score, 4),
+        }
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def text_id(text):
+    """Stable id for results that have no natural id"""
+    return hashlib.sha1(" ".join(text.split()).lower().encode("utf-8")).hexdigest()[:16]
+
+
+def dedupe(results):
+    """
+    Drop repeated results (same id or same normalized text), keeping the highest-scored
+    copy; a document copy beats a web copy since their scores are not comparable
+    """
+    seen = set()
+    unique = []
+    for result in sorted(results, key=lambda r: (r.source == SOURCE_DOCS, r.score), reverse=True):
+        keys = (result.id, text_id(result.text))
+        if seen.intersection(keys):
+            continue
+        seen.update(keys)
+        unique.append(result)
+    if len(unique) < len(results):
+        logger.info(f"Removed {len(results) - len(unique)} duplicate result(s)")
+    return unique
+
+
+def source_budgets(results, max_chars, shares):
+    """
+    Characters per source: max_chars split by `shares` ({source: fraction}), with
+    what a source cannot fill handed to the sources after it in `shares` order
+    """
+    budgets = {source: int(max_chars * share) for source, share in shares.items()}
+    needs = {source: sum(len(r.text) for r in results if r.source == source) for source in shares}
+    spare = sum(max(0, budgets[source] - needs[source]) for source in shares)
+    for source in shares:
+        budgets[source] = min(budgets[source], needs[source])
+    for source in shares:
+        extra = min(spare, needs[source] - budgets[source])
+        budgets[source] += extra
+        spare -= extra
+    return budgets
+
+
+def pack_context(results, max_chars=4000, min_tail=100, shares=None):
+    """
+    Pick results in descending score order until max_chars is reached.
+    Scores only rank results of one source, so with `shares` ({source: fraction of
+    max_chars}) each source is packed by its own scores into its own budget (see
+    source_budgets), sources in `shares` order; results of other sources are dropped.
+    Returns (packed, texts): the chosen records and their (possibly truncated) texts.
+    """
+    if shares:
+        packed, texts = [], []
+        for source, budget in source_budgets(results, max_chars, shares).items():
+            source_packed, source_texts = pack_context([r for r in results if r.source == source], budget, min_tail)
+            packed.extend(source_packed)
+            texts.extend(source_texts)
+        return packed, texts
+
+    packed, texts = [], []
+    total_length = 0
+    for result in sorted(results, key=lambda r: r.score, reverse=True):
+        if total_length + len(result.text) <= max_chars:
+            packed.append(result)
+            texts.append(result.text)
+            total_length += len(result.text)
+        else:
+            # Truncate the last item if needed
+            remaining = max_chars - total_length
+            if remaining > min_tail:  # Only add if meaningful length remains
+                packed.append(result)
+                texts.append(result.text[:remaining] + "...")
+            break
+    return packed, texts
@@ -0,0 +1,234 @@
+"""
+Tiered model routing for answer generation.
+Easy queries are answered by a fast Gemini model; hard or poorly grounded
+queries (and weak fast answers) are escalated to gemini-2.5-pro.
+"""
+
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# finish_reason values: 1=STOP, 2=MAX_TOKENS, 3=SAFETY, 4=RECITATION, 5=OTHER
+FINISH_STOP = 1
+FINISH_MAX_TOKENS = 2
+FINISH_SAFETY = 3
+
+# Queries that usually need reasoning beyond a lookup in the retrieved context
+COMPLEX_QUERY_PATTERN = re.compile(
+    r"\b(compare|comparison|difference|differences|versus|vs\.?|why|strategy|strategies|plan|"
+    r"step[- ]by[- ]step|optimi[sz]e|troubleshoot|analy[sz]e|recommend|pros and cons)\b",
+    re.IGNORECASE,
+)
+
+# Phrases a fast model uses when the context did not let it answer properly
+UNCERTAIN_ANSWER_PATTERN = re.compile(
+    r"(context (does not|doesn't) (fully )?(answer|contain|provide|mention)|"
+    r"not enough information|insufficient information|cannot determine|"
+    r"i (do not|don't) know|unable to (answer|find))",
+    re.IGNORECASE,
+)
+
+
+def extract_response_text(response):
+    """Return (text, finish_reason) from a Gemini response, tolerating blocked or partial candidates"""
+    finish_reason = None
+    if hasattr(response, 'candidates') and response.candidates:
+        finish_reason = response.candidates[0].finish_reason
+
+    # response.text raises when the candidate has no parts (e.g. safety blocks)
+    try:
+        text = response.text
+    except Exception:
+        text = None
+    if text:
+        return text, finish_reason
+
+    # Try to extract from candidates manually
+    if hasattr(response, 'candidates') and response.candidates:
+        for candidate in response.candidates:
+            if hasattr(candidate, 'content') and candidate.content and candidate.content.parts:
+                for part in candidate.content.parts:
+                    if hasattr(part, 'text') and part.text:
+                        return part.text, finish_reason
+
+    return None, finish_reason
+
+
+@dataclass
+class ModelTier:
+    """A model plus its pricing and running latency/cost counters"""
+    name: str
+    model: object  # anything exposing generate_content(prompt)
+    cost_in_per_m: float = 0.0
+    cost_out_per_m: float = 0.0
+    calls: int = 0
+    failures: int = 0
+    total_latency: float = 0.0
+    ewma_latency: float = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total_cost: float = 0.0
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "avg_latency_ms": round(1000 * self.total_latency / self.calls, 1) if self.calls else None,
+            "ewma_latency_ms": round(1000 * self.ewma_latency, 1) if self.ewma_latency is not None else None,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.total_cost, 6),
+        }
+
+
+@dataclass
+class RoutedAnswer:
+    """Outcome of a routed generation"""
+    text: str
+    tier: str
+    reason: str
+    escalated: bool = False
+    finish_reason: int = None
+    latency_ms: float = 0.0
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) when the API does not report usage"""
+    return max(1, len(text or "") // 4)
+
+
+class ModelRouter:
+    """Route a prompt to the fast tier first and escalate to the pro tier only when needed"""
+
+    def __init__(self, fast, pro, latency_slo_ms=12000, min_fast_score=0.45, max_fast_words=25, call=None):
+        self.fast = fast
+        self.pro = pro
+        self.latency_slo = latency_slo_ms / 1000.0
+        self.min_fast_score = min_fast_score
+        self.max_fast_words = max_fast_words
+        # call(fn, prompt, deadline=...) wraps every model call, e.g. with a circuit breaker and timeout
+        self.call = call or (lambda fn, prompt, deadline=None: fn(prompt))
+        self.escalations = 0
+        self.slo_misses = 0
+        self._lock = threading.Lock()
+
+    def choose_tier(self, query, scores):
+        """Pick the starting tier from retrieval confidence, query length and wording"""
+        top_score = max(scores) if scores else None
+        if top_score is None or top_score < self.min_fast_score:
+            return self.pro, f"low retrieval confidence (top score {top_score})"
+        if len(query.split()) > self.max_fast_words:
+            return self.pro, f"long query ({len(query.split())} words)"
+        if COMPLEX_QUERY_PATTERN.search(query):
+            return self.pro, "complex query wording"
+        return self.fast, f"confident retrieval (top score {top_score:.3f})"
+
+    def generate(self, prompt, query, scores=None, deadline=None):
+        """Generate an answer, returning a RoutedAnswer. Errors from the last tier tried propagate."""
+        start = time.monotonic()
+        tier, reason = self.choose_tier(query, scores or [])
+        logger.info(f"Routing query to '{tier.name}' tier: {reason}")
+
+        if tier is self.pro:
+            text, finish_reason = self._invoke(self.pro, prompt, deadline)
+            return self._finish(start, text, self.pro, reason, False, finish_reason)
+
+        try:
+            text, finish_reason = self._invoke(self.fast, prompt, deadline)
+        except Exception as fast_error:
+            logger.warning(f"Fast tier failed, escalating: {fast_error}")
+            text, finish_reason = self._invoke(self.pro, prompt, deadline)
+            return self._finish(start, text, self.pro, "fast tier error", True, finish_reason)
+
+        if finish_reason == FINISH_SAFETY:
+            # A stronger model will not change a safety block
+            return self._finish(start, text, self.fast, reason, False, finish_reason)
+
+        weakness = self._weakness(text, finish_reason)
+        if not weakness:
+            return self._finish(start, text, self.fast, reason, False, finish_reason)
+
+        # Only escalate when the pro tier is expected to fit in the remaining SLO,
+        # unless the fast tier produced nothing usable at all
+        remaining = self.latency_slo - (time.monotonic() - start)
+        if deadline is not None:
+            remaining = min(remaining, deadline.remaining())
+        expected = self.pro.ewma_latency or 0.0
+        if text and expected > remaining:
+            logger.info(f"Fast answer is weak ({weakness}) but pro tier would miss the SLO "
+                        f"(expected {expected:.2f}s, remaining {remaining:.2f}s); keeping fast answer")
+            return self._finish(start, text, self.fast, f"{reason}; kept despite {weakness}", False, finish_reason)
+
+        logger.info(f"Escalating to '{self.pro.name}' tier: {weakness}")
+        text, finish_reason = self._invoke(self.pro, prompt, deadline)
+        return self._finish(start, text, self.pro, weakness, True, finish_reason)
+
+    def _weakness(self, text, finish_reason):
+        """Return why a fast answer should be escalated, or None if it is good enough"""
+        if not text:
+            return "empty fast answer"
+        if finish_reason == FINISH_MAX_TOKENS:
+            return "fast answer truncated"
+        if finish_reason not in (None, FINISH_STOP):
+            return f"unexpected finish_reason {finish_reason}"
+        if UNCERTAIN_ANSWER_PATTERN.search(text):
+            return "fast answer reports missing information"
+        return None
+
+    def _invoke(self, tier, prompt, deadline=None):
+        """Call one tier and record its latency, token usage and cost"""
+        start = time.monotonic()
+        try:
+            response = self.call(tier.model.generate_content, prompt, deadline=deadline)
+        except Exception:
+            with self._lock:
+                tier.calls += 1
+                tier.failures += 1
+                tier.total_latency += time.monotonic() - start
+            raise
+        latency = time.monotonic() - start
+        text, finish_reason = extract_response_text(response)
+
+        usage = getattr(response, 'usage_metadata', None)
+        input_tokens = getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt)
+        output_tokens = getattr(usage, 'candidates_token_count', None) or estimate_tokens(text)
+        cost = (input_tokens * tier.cost_in_per_m + output_tokens * tier.cost_out_per_m) / 1_000_000
+
+        with self._lock:
+            tier.calls += 1
+            tier.total_latency += latency
+            tier.ewma_latency = latency if tier.ewma_latency is None else 0.8 * tier.ewma_latency + 0.2 * latency
+            tier.input_tokens += input_tokens
+            tier.output_tokens += output_tokens
+            tier.total_cost += cost
+
+        logger.info(f"Tier '{tier.name}' responded in {latency * 1000:.0f}ms "
+                    f"({input_tokens} in / {output_tokens} out tokens, ${cost:.6f})")
+        return text, finish_reason
+
+    def _finish(self, start, text, tier, reason, escalated, finish_reason):
+        latency = time.monotonic() - start
+        with self._lock:
+            if escalated:
+                self.escalations += 1
+            if latency > self.latency_slo:
+                self.slo_misses += 1
+        if latency > self.latency_slo:
+            logger.warning(f"Generation took {latency * 1000:.0f}ms, over the {self.latency_slo * 1000:.0f}ms SLO")
+        return RoutedAnswer(text=text, tier=tier.name, reason=reason, escalated=escalated,
+                            finish_reason=finish_reason, latency_ms=latency * 1000)
+
+    def stats(self):
+        """Snapshot of routing counters for the /debug endpoint"""
+        with self._lock:
+            return {
+                "latency_slo_ms": round(self.latency_slo * 1000),
+                "escalations": self.escalations,
+                "slo_misses": self.slo_misses,
+                "tiers": {self.fast.name: self.fast.stats(), self.pro.name: self.pro.stats()},
+            }
@@ -1,11 +1,43 @@
 from serpapi import GoogleSearch
 from config import SERPAPI_API_KEY, PRIORITY_LINKS
+from resilience_module import guarded_call, call_timeout, CircuitOpenError, DeadlineExceeded
+from results_module import RetrievedDoc, SOURCE_WEB, text_id
 import logging
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def serpapi_search(query, priority_links=[]):
+# Web results carry no similarity score; rank them by position, trusting priority sites more.
+# These scores only order web results among themselves (see results_module.pack_context)
+PRIORITY_SITE_SCORE = 0.8
+GENERIC_SEARCH_SCORE = 0.6
+
+def web_results(organic_results, base_score):
+    """Convert SerpAPI organic results into RetrievedDoc records"""
+    results = []
+    for i, item in enumerate(organic_results):
+        snippet = (item.get("snippet") or "").strip()
+        if len(snippet) <= 10:  # Filter out very short snippets
+            continue
+        position = item.get("position") or i + 1
+        link = item.get("link", "")
+        results.append(RetrievedDoc(
+            text=snippet,
+            score=base_score / (1 + 0.1 * (position - 1)),
+            source=SOURCE_WEB,
+            id=f"web:{link or text_id(snippet)}",
+            title=item.get("title", ""),
+            url=link
+        ))
+    return results
+
+def google_search(params, deadline=None):
+    """GoogleSearch whose HTTP request gives up with our timeout (the library default is 60000s)"""
+    search = GoogleSearch(params)
+    search.timeout = max(0.5, call_timeout("serpapi", deadline))
+    return search
+
+def serpapi_search(query, priority_links=[], deadline=None):
     logger.info(f"Starting SerpAPI search for query: '{query}'")
     logger.info(f"Priority links: {priority_links}")
     
@@ -17,19 +49,22 @@ def serpapi_search(query, priority_links=[]):
             logger.debug(f"Searching priority site {i+1}/{len(priority_links)}: {site}")
             
             try:
-                search = GoogleSearch({
+                search = google_search({
                     "q": f"site:{site} {query}",
                     "api_key": SERPAPI_API_KEY
-                })
-                data = search.get_dict()
+                }, deadline)
+                data = guarded_call("serpapi", search.get_dict, deadline=deadline)
                 
                 organic_results = data.get("organic_results", [])
                 logger.debug(f"Found {len(organic_results)} results from {site}")
                 
-                snippets = [item.get("snippet", "") for item in organic_results if item.get("snippet")]
+                snippets = web_results(organic_results, PRIORITY_SITE_SCORE)
                 results.extend(snippets)
                 logger.debug(f"Added {len(snippets)} snippets from {site}")
                 
+            except (CircuitOpenError, DeadlineExceeded) as budget_error:
+                logger.warning(f"Stopping priority search early: {budget_error}")
+                break
             except Exception as site_error:
                 logger.warning(f"Error searching site {site}: {site_error}")
                 continue
@@ -37,35 +72,29 @@ def serpapi_search(query, priority_links=[]):
         logger.info(f"Priority search completed. Found {len(results)} results from priority sites")
         
         # Fallback to generic search if nothing found
-        if not results:
+        if not results and not (deadline and deadline.expired()):
             logger.info("No results from priority sites, performing generic search...")
             
             try:
-                search = GoogleSearch({
+                search = google_search({
                     "q": query, 
                     "api_key": SERPAPI_API_KEY,
                     "num": 5  # Limit results
-                })
-                data = search.get_dict()
+                }, deadline)
+                data = guarded_call("serpapi", search.get_dict, deadline=deadline)
                 
                 organic_results = data.get("organic_results", [])
                 logger.info(f"Generic search found {len(organic_results)} results")
                 
-                snippets = [item.get("snippet", "") for item in organic_results if item.get("snippet")]
+                snippets = web_results(organic_results, GENERIC_SEARCH_SCORE)
                 results.extend(snippets)
                 logger.info(f"Added {len(snippets)} snippets from generic search")
                 
             except Exception as generic_error:
                 logger.error(f"Error in generic search: {generic_error}")
         
-        # Filter and clean results
-        cleaned_results = []
-        for result in results:
-            if result and len(result.strip()) > 10:  # Filter out very short snippets
-                cleaned_results.append(result.strip())
-        
-        logger.info(f"SerpAPI search completed. Returning {len(cleaned_results)} cleaned results")
-        return cleaned_results
+        logger.info(f"SerpAPI search completed. Returning {len(results)} results")
+        return results
         
     except Exception as e:
         logger.error(f"Error in serpapi_search: {str(e)}")
@@ -0,0 +1,105 @@
+"""
+Test neighbour-window arithmetic, overlap stitching and passage merging on real chunk_text output (no Qdrant needed)
+"""
+
+from pathlib import Path
+
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+import rag_module
+from chunk_store import ChunkStore, chunk_text
+from rag_module import neighbor_window, stitch_chunks, expand_to_parents
+from config import EMBED_CHUNK_CHARS, CHUNK_OVERLAP_CHARS
+from results_module import RetrievedDoc, SOURCE_DOCS
+
+GUIDE = Path(__file__).parent / "documents" / "business_manager_guide.txt"
+SOURCE = "documents/business_manager_guide.txt"
+
+def guide_chunks():
+    return chunk_text(GUIDE.read_text(encoding="utf-8").strip(), EMBED_CHUNK_CHARS, CHUNK_OVERLAP_CHARS)
+
+def hit(chunk_id, total, score, source=SOURCE, text=None, ingested_at=None):
+    return RetrievedDoc(text or f"chunk {chunk_id}", score, SOURCE_DOCS, f"docs:{source}#{chunk_id}",
+                        metadata={"filename": Path(source).name, "source_path": source,
+                                  "chunk_id": chunk_id, "total_chunks": total, "ingested_at": ingested_at})
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    chunk_store = ChunkStore(str(tmp_path / "chunks.db"))
+    chunk_store.replace_file(SOURCE, GUIDE.name, guide_chunks())
+    monkeypatch.setattr(rag_module, "chunk_store", chunk_store)
+    return chunk_store
+
+def test_stitching_all_chunks_restores_the_original_text():
+    text = GUIDE.read_text(encoding="utf-8").strip()
+    chunks = guide_chunks()
+    assert len(chunks) > 3
+    assert stitch_chunks(chunks) == text
+
+def test_stitching_a_window_restores_that_span():
+    text = GUIDE.read_text(encoding="utf-8")
+    stitched = stitch_chunks(guide_chunks()[2:5])
+    assert stitched in text and len(stitched) > 2 * EMBED_CHUNK_CHARS
+
+def test_window_is_centred_and_clamped_at_both_ends():
+    total = 20
+    first, last = neighbor_window(10, total, max_chars=800)
+    assert first <= 10 <= last and last - first >= 1
+    width = last - first
+    assert neighbor_window(0, total, 800) == (0, width)
+    assert neighbor_window(total - 1, total, 800) == (total - 1 - width, total - 1)
+    assert neighbor_window(0, 1, 800) == (0, 0)
+    # A window no wider than one chunk is just the chunk
+    assert neighbor_window(7, total, max_chars=EMBED_CHUNK_CHARS) == (7, 7)
+
+def test_hit_expands_to_its_stitched_neighbourhood(store):
+    chunks = guide_chunks()
+    total = len(chunks)
+    [passage] = expand_to_parents([hit(3, total, 0.7, text=chunks[3])])
+    first, last = passage.metadata["chunk_range"]
+    assert (first, last) == neighbor_window(3, total)
+    assert passage.text == stitch_chunks(chunks[first:last + 1]) and chunks[3] in passage.text
+    assert passage.score == 0.7
+
+def test_touching_windows_of_one_file_merge_keeping_best_score(store):
+    total = len(guide_chunks())
+    first, last = neighbor_window(3, total)
+    passages = expand_to_parents([hit(3, total, 0.6), hit(last + 1, total, 0.8)])
+    assert len(passages) == 1 and passages[0].score == 0.8
+    assert passages[0].metadata["chunk_range"][0] <= first
+
+def test_windows_of_different_files_do_not_merge(store):
+    # Same filename, different folder: keyed by source path, so never interleaved
+    upload = "documents/uploads/business_manager_guide.txt"
+    chunks = guide_chunks()
+    store.replace_file(upload, GUIDE.name, chunks)
+    passages = expand_to_parents([hit(3, len(chunks), 0.6), hit(3, len(chunks), 0.5, source=upload)])
+    assert len(passages) == 2 and passages[0].text == passages[1].text
+
+def test_single_chunk_documents_pass_through(store):
+    single = hit(0, 1, 0.9, text="whole document")
+    assert expand_to_parents([single]) == [single]
+
+def test_hit_from_a_newer_upload_is_not_stitched_with_stored_chunks(store, monkeypatch):
+    # Mid re-upload: Qdrant holds both versions, the chunk store still the previous one
+    store.replace_file(SOURCE, GUIDE.name, guide_chunks(), ingested_at=100)
+    total = len(guide_chunks())
+    client = QdrantClient(":memory:")
+    client.create_collection(rag_module.QDRANT_COLLECTION,
+                             vectors_config=models.VectorParams(size=2, distance=models.Distance.COSINE))
+    client.upsert(rag_module.QDRANT_COLLECTION, points=[
+        models.PointStruct(id=version * 1000 + i, vector=[1.0, 0.0],
+                           payload={"source": SOURCE, "chunk_id": i, "ingested_at": version,
+                                    "text": f"version {version} chunk {i}."})
+        for version in (100, 200) for i in range(total)
+    ])
+    monkeypatch.setattr(rag_module, "client", client)
+
+    [old] = expand_to_parents([hit(3, total, 0.7, ingested_at=100)])
+    first, last = old.metadata["chunk_range"]
+    assert old.text == stitch_chunks(guide_chunks()[first:last + 1])
+    [new, other] = expand_to_parents([hit(3, total, 0.7, ingested_at=200), hit(4, total, 0.6, ingested_at=100)])
+    assert "version 200 chunk 3." in new.text and "version 100" not in new.text
+    assert other.metadata["ingested_at"] == 100
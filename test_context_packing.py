@@ -0,0 +1,46 @@
+"""
+Test result deduplication and per-source context packing (no services needed)
+"""
+
+from results_module import RetrievedDoc, SOURCE_DOCS, SOURCE_WEB, dedupe, pack_context, source_budgets
+
+def doc(text, score, id=None):
+    return RetrievedDoc(text, score, SOURCE_DOCS, id or f"docs:{text[:8]}")
+
+def web(text, score, id=None):
+    return RetrievedDoc(text, score, SOURCE_WEB, id or f"web:{text[:8]}")
+
+SHARES = {SOURCE_DOCS: 0.6, SOURCE_WEB: 0.4}
+
+def test_dedupe_drops_same_id_and_same_normalized_text():
+    results = [doc("Budget  optimization", 0.4, id="docs:1"), doc("other text", 0.9, id="docs:1"),
+               doc("budget optimization", 0.7, id="docs:2")]
+    assert [r.score for r in dedupe(results)] == [0.9, 0.7]
+
+def test_dedupe_keeps_the_document_copy_over_a_higher_scored_web_copy():
+    [kept] = dedupe([web("Lookalike audiences explained", 0.8), doc("lookalike audiences  explained", 0.5)])
+    assert kept.source == SOURCE_DOCS
+
+def test_high_web_scores_do_not_crowd_out_documents():
+    results = [web("w" * 500, 0.8 - i / 100, id=f"web:{i}") for i in range(8)]
+    results += [doc("d" * 500, 0.45 - i / 100, id=f"docs:{i}") for i in range(8)]
+    packed, texts = pack_context(results, max_chars=2000, shares=SHARES)
+    assert sum(len(t) for t in texts if not t.endswith("...")) <= 2000
+    assert [r.source for r in packed] == [SOURCE_DOCS] * 3 + [SOURCE_WEB] * 2
+    # Within a source, results still go by their own score
+    assert [r.id for r in packed[:3]] == ["docs:0", "docs:1", "docs:2"]
+
+def test_budget_a_source_leaves_unused_goes_to_the_other():
+    assert source_budgets([doc("d" * 300, 0.9), web("w" * 5000, 0.8)], 4000, SHARES) == {
+        SOURCE_DOCS: 300, SOURCE_WEB: 3700}
+    packed, _ = pack_context([doc("d" * 300, 0.9)] + [web("w" * 900, 0.8, id=f"web:{i}") for i in range(4)],
+                             4000, shares=SHARES)
+    assert len(packed) == 5
+
+def test_without_shares_results_are_packed_by_score_and_the_tail_truncated():
+    results = [doc("a" * 600, 0.9), web("b" * 600, 0.8), doc("c" * 600, 0.7)]
+    packed, texts = pack_context(results, max_chars=1500)
+    assert [r.score for r in packed] == [0.9, 0.8, 0.7]
+    assert texts[2] == "c" * 300 + "..."
+    packed, _ = pack_context(results, max_chars=1250)  # 50 characters left is below min_tail
+    assert len(packed) == 2
@@ -0,0 +1,41 @@
+"""
+Test translation of retrieval filters into Qdrant filters (no Qdrant needed)
+"""
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from rag_module import DocFilter
+
+def conditions(doc_filter):
+    return {condition.key: condition for condition in doc_filter.to_qdrant().must}
+
+def test_empty_filter_does_not_filter():
+    assert DocFilter().to_qdrant() is None
+    assert DocFilter(file_types=[], sources=[]).to_qdrant() is None
+
+def test_file_types_are_normalized_to_lowercase_extensions():
+    condition = conditions(DocFilter(file_types=["md", ".MD", "Pdf"]))["file_type"]
+    assert condition.match == models.MatchAny(any=[".md", ".md", ".pdf"])
+
+def test_filenames_and_sources_match_any_value():
+    found = conditions(DocFilter(filenames=["guide.md"], sources=["documents/a.md", "documents/uploads/a.md"]))
+    assert found["filename"].match == models.MatchAny(any=["guide.md"])
+    assert found["source"].match == models.MatchAny(any=["documents/a.md", "documents/uploads/a.md"])
+
+def test_ingested_at_range_may_be_open_ended():
+    assert conditions(DocFilter(ingested_after=100))["ingested_at"].range == models.Range(gte=100)
+    assert conditions(DocFilter(ingested_before=200))["ingested_at"].range == models.Range(lte=200)
+    assert conditions(DocFilter(ingested_after=100, ingested_before=200))["ingested_at"].range == models.Range(gte=100, lte=200)
+    # 0 is a timestamp, not "unset"
+    assert conditions(DocFilter(ingested_after=0))["ingested_at"].range == models.Range(gte=0)
+
+def test_filter_selects_points_on_an_in_memory_qdrant():
+    client = QdrantClient(":memory:")
+    client.create_collection("docs", vectors_config=models.VectorParams(size=2, distance=models.Distance.COSINE))
+    client.upsert("docs", points=[
+        models.PointStruct(id=i, vector=[1.0, float(i)], payload={"file_type": file_type, "ingested_at": ingested_at})
+        for i, (file_type, ingested_at) in enumerate([(".md", 100), (".md", 300), (".pdf", 300)])
+    ])
+    points, _ = client.scroll("docs", scroll_filter=DocFilter(file_types=["MD"], ingested_after=200).to_qdrant())
+    assert [point.id for point in points] == [1]
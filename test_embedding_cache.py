@@ -0,0 +1,111 @@
+"""
+Test the query embedding cache and query normalization with plain vectors (no model needed)
+"""
+
+import numpy as np
+
+from embedding_module import EmbeddingCache, normalize_query
+
+def vector(value, dim=4):
+    return np.full(dim, value, dtype=np.float32)
+
+def test_normalize_query_folds_case_whitespace_and_punctuation():
+    assert normalize_query("Facebook Ads targeting?") == normalize_query("  facebook \t ads\ntargeting ")
+    assert normalize_query("ＦＡＣＥＢＯＯＫ ads") == "facebook ads"  # NFKC folds full-width letters
+    assert normalize_query('"What is CPC?!"') == "what is cpc"
+    assert normalize_query("CPC vs CPM") != normalize_query("CPM vs CPC")
+
+def test_hits_and_misses_are_counted():
+    cache = EmbeddingCache(capacity=2, dtype="float32")
+    assert cache.get("a") is None
+    cache.put("a", vector(1))
+    np.testing.assert_array_equal(cache.get("a"), vector(1))
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["size"] == 1
+
+def test_least_recently_used_entry_is_evicted():
+    cache = EmbeddingCache(capacity=2, dtype="float32")
+    cache.put("a", vector(1))
+    cache.put("b", vector(2))
+    cache.get("a")  # "b" is now least recently used
+    cache.put("c", vector(3))
+    assert cache.get("b") is None
+    np.testing.assert_array_equal(cache.get("a"), vector(1))
+    np.testing.assert_array_equal(cache.get("c"), vector(3))
+
+def test_evicted_slot_is_reused_and_overwritten():
+    cache = EmbeddingCache(capacity=2, dtype="float32")
+    cache.put("a", vector(1))
+    cache.put("b", vector(2))
+    slot_a = cache.slots["a"]
+    cache.put("c", vector(3))
+    assert cache.slots["c"] == slot_a and not cache.free
+    np.testing.assert_array_equal(cache.vectors[slot_a], vector(3))
+    # Updating an existing key keeps its slot
+    cache.put("c", vector(4))
+    assert cache.slots["c"] == slot_a and len(cache.slots) == 2
+
+def test_float16_storage_returns_float32_close_to_input():
+    cache = EmbeddingCache(capacity=4, dtype="float16")
+    original = np.array([0.123456, -0.5, 0.999, 1e-3], dtype=np.float32)
+    cache.put("q", original)
+    restored = cache.get("q")
+    assert cache.vectors.dtype == np.float16 and restored.dtype == np.float32
+    np.testing.assert_allclose(restored, original, rtol=1e-3, atol=1e-4)
+
+def test_mismatched_dimension_is_ignored():
+    cache = EmbeddingCache(capacity=2, dtype="float32")
+    cache.put("a", vector(1, dim=4))
+    cache.put("b", vector(2, dim=3))
+    assert cache.get("b") is None and cache.stats()["size"] == 1
+
+def test_flush_and_warm_start_keep_frequent_entries(tmp_path):
+    path = str(tmp_path / "cache" / "queries.npy")
+    cache = EmbeddingCache(capacity=3, dtype="float16", path=path)
+    for key, value in (("rare", 1), ("frequent", 2), ("medium", 3)):
+        cache.put(key, vector(value))
+    for _ in range(3):
+        cache.get("frequent")
+    cache.get("medium")
+    cache.flush()
+
+    warm = EmbeddingCache(capacity=3, dtype="float16", path=path)
+    assert list(warm.slots) == ["rare", "medium", "frequent"]  # least used first, evicted first
+    np.testing.assert_array_equal(warm.get("frequent"), vector(2))
+    warm.put("new", vector(4))
+    assert "rare" not in warm.slots and "frequent" in warm.slots
+
+def test_warm_start_ignores_mismatched_files(tmp_path):
+    path = str(tmp_path / "queries.npy")
+    cache = EmbeddingCache(capacity=3, dtype="float16", path=path)
+    cache.put("a", vector(1))
+    cache.flush()
+    assert not EmbeddingCache(capacity=5, dtype="float16", path=path).slots
+    assert not EmbeddingCache(capacity=3, dtype="float32", path=path).slots
+
+def test_warm_start_ignores_files_of_another_model_or_dim(tmp_path):
+    path = str(tmp_path / "queries.npy")
+    cache = EmbeddingCache(capacity=3, dtype="float16", path=path, model="model-a", dim=4)
+    cache.put("a", vector(1))
+    cache.flush()
+    assert EmbeddingCache(capacity=3, dtype="float16", path=path, model="model-a", dim=4).slots
+    assert not EmbeddingCache(capacity=3, dtype="float16", path=path, model="model-b", dim=4).slots
+    assert not EmbeddingCache(capacity=3, dtype="float16", path=path, model="model-a", dim=8).slots
+    assert not EmbeddingCache(capacity=3, dtype="float16", path=path).slots  # model not recorded
+
+def test_configured_dim_refuses_other_sizes_from_the_first_put():
+    cache = EmbeddingCache(capacity=2, dtype="float32", dim=4)
+    cache.put("a", vector(1, dim=3))
+    cache.put("b", np.ones((1, 4), dtype=np.float32))
+    assert cache.vectors is None and not cache.slots
+    cache.put("c", vector(1))
+    assert cache.vectors.shape == (2, 4) and cache.get("c") is not None
+
+def test_flush_without_changes_or_path_writes_nothing(tmp_path):
+    memory_only = EmbeddingCache(capacity=2, dtype="float32")
+    memory_only.put("a", vector(1))
+    memory_only.flush()
+    path = tmp_path / "queries.npy"
+    cache = EmbeddingCache(capacity=2, dtype="float32", path=str(path))
+    cache.flush()
+    assert not path.exists()
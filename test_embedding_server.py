@@ -0,0 +1,88 @@
+"""
+Test the embedding server wire protocol end to end with a stub model (no sentence-transformers needed)
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+
+from embedding_server import HEADER, LENGTH, EmbeddingServer, RemoteEmbeddingModel, _recv_exact
+
+class StubModel:
+    """Embeds a text as [len(text), 1, 0]; fails on "boom" and blocks while `hang` is unset"""
+    def __init__(self):
+        self.hang = None
+
+    def encode(self, texts, batch_size=32):
+        if self.hang is not None:
+            self.hang.wait(5)
+        if "boom" in texts:
+            raise ValueError("cannot embed boom")
+        return np.array([[len(text), 1.0, 0.0] for text in texts], dtype=np.float32)
+
+@pytest.fixture
+def server():
+    # Unix socket paths are limited to ~100 characters, so not under pytest's tmp_path
+    folder = tempfile.mkdtemp(prefix="embed-")
+    model = StubModel()
+    server = EmbeddingServer(os.path.join(folder, "embed.sock"), model)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield server, model
+    if model.hang is not None:
+        model.hang.set()
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(folder)
+
+def test_round_trip_returns_one_row_per_text(server):
+    client = RemoteEmbeddingModel(server[0].server_address)
+    vectors = client.encode(["a", "bbb"])
+    np.testing.assert_array_equal(vectors, [[1, 1, 0], [3, 1, 0]])
+    np.testing.assert_array_equal(client.encode("hello"), [5, 1, 0])
+    assert client.get_sentence_embedding_dimension() == 3
+
+def test_concurrent_requests_each_get_their_own_rows(server):
+    client = RemoteEmbeddingModel(server[0].server_address)
+    results = {}
+    def run(n):
+        results[n] = client.encode(["x" * n] * n)
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(1, 9)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for n, vectors in results.items():
+        assert vectors.shape == (n, 3) and (vectors[:, 0] == n).all()
+
+def test_model_error_is_raised_and_connection_stays_usable(server):
+    client = RemoteEmbeddingModel(server[0].server_address)
+    with pytest.raises(RuntimeError, match="cannot embed boom"):
+        client.encode(["boom"])
+    np.testing.assert_array_equal(client.encode(["ok"]), [[2, 1, 0]])
+
+def test_empty_input_returns_no_rows(server):
+    client = RemoteEmbeddingModel(server[0].server_address)
+    assert client.encode([]).shape == (0, 0)
+    client.encode(["warm"])
+    assert client.encode([]).shape == (0, 3)
+    # The server answers an empty request too (0 rows, 0 dim) instead of failing to pack a 1-D array
+    sock = client._sock()
+    body = json.dumps({"texts": []}).encode("utf-8")
+    sock.sendall(LENGTH.pack(len(body)) + body)
+    assert HEADER.unpack(_recv_exact(sock, HEADER.size)) == (0, 0)
+
+def test_timeout_drops_the_connection_so_late_replies_are_not_misread(server):
+    _, model = server
+    client = RemoteEmbeddingModel(server[0].server_address, timeout=0.2)
+    model.hang = threading.Event()
+    with pytest.raises(TimeoutError):
+        client.encode(["slow"])
+    assert client._local.sock is None
+    model.hang.set()
+    model.hang = None
+    np.testing.assert_array_equal(client.encode(["fast!"]), [[5, 1, 0]])
@@ -0,0 +1,104 @@
+"""
+Test the background ingestion pipeline with stub stages (no parsers, model or Qdrant needed)
+"""
+
+import threading
+from pathlib import Path
+
+import pytest
+
+import ingest_module
+from ingest_module import IngestQueue, JobStore, get_job_progress, resolve_paths
+
+class StubStages(dict):
+    """Stage functions that record what reached Qdrant; files named broken* fail to parse"""
+    def __init__(self, chunks_per_file=3):
+        self.chunks_per_file = chunks_per_file
+        self.failing_sources = set()  # upserts containing these sources fail
+        self.upserted, self.finished, self.discarded = [], [], []
+        super().__init__(
+            prepare=lambda: None,
+            chunk_file=self.chunk_file,
+            embed=lambda texts: [[1.0, 0.0] for _ in texts],
+            make_point=lambda doc, i, embedding, ingested_at: (doc["source"], doc["chunk_id"]),
+            upsert=self.upsert,
+            finish_file=lambda docs, ingested_at: self.finished.append(docs[0]["source"]),
+            discard_file=lambda docs, ingested_at: self.discarded.append(docs[0]["source"]),
+        )
+
+    def chunk_file(self, path):
+        if Path(path).name.startswith("broken"):
+            raise ValueError("cannot parse")
+        return [{"text": f"{path} {i}", "source": path, "chunk_id": i} for i in range(self.chunks_per_file)]
+
+    def upsert(self, points):
+        if any(source in self.failing_sources for source, _ in points):
+            raise ConnectionError("qdrant down")
+        self.upserted.extend(points)
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+def run_job(stages, files, store=None):
+    done = threading.Event()
+    queue = IngestQueue(stages, cpu_share=1.0, embed_batch=2, upsert_batch=2,
+                        on_job_done=lambda job: done.set(), store=store)
+    job = queue.submit(files)
+    assert done.wait(5)
+    return job
+
+def test_job_ingests_every_file(store):
+    stages = StubStages()
+    job = run_job(stages, ["a.md", "b.md"], store)
+    assert job.status == "done" and not job.errors
+    assert job.chunks_total == job.chunks_embedded == job.chunks_upserted == 6
+    assert sorted(stages.finished) == ["a.md", "b.md"] and not stages.discarded
+    assert job.progress()["files_ingested"] == 2 and store.generation() == 1
+
+def test_file_that_cannot_be_extracted_is_reported_and_skipped(store):
+    stages = StubStages()
+    job = run_job(stages, ["a.md", "broken.pdf"], store)
+    assert job.status == "done_with_errors" and stages.finished == ["a.md"]
+    assert job.errors == ["broken.pdf: cannot parse"] and job.files_done == 2
+
+def test_failed_upsert_rolls_the_file_back():
+    stages = StubStages(chunks_per_file=2)
+    stages.failing_sources.add("b.md")
+    job = run_job(stages, ["a.md", "b.md"])
+    assert job.status == "done_with_errors"
+    assert stages.finished == ["a.md"] and stages.discarded == []  # no chunk of b.md was stored
+    assert "b.md: 0/2 chunks stored, kept the previous version" in job.errors
+
+def test_partly_stored_file_is_discarded_and_nothing_stored_is_failed():
+    stages = StubStages(chunks_per_file=3)  # batches of 2: b.md's first chunk shares a batch with a.md
+    stages.failing_sources.add("a.md")
+    job = run_job(stages, ["a.md", "b.md"])
+    assert job.status == "failed" and not stages.finished
+    assert stages.discarded == ["b.md"]
+    assert "b.md: 2/3 chunks stored, kept the previous version" in job.errors
+
+def test_other_queue_reads_status_from_the_shared_store(store):
+    job = run_job(StubStages(), ["a.md"], store)
+    other = IngestQueue(StubStages(), store=JobStore(store.path))
+    assert other.get(job.id) is None
+    assert other.progress(job.id) == job.progress() and other.progress(job.id)["status"] == "done"
+    assert other.progress("unknown") is None
+
+def test_status_poll_without_a_local_queue_reads_the_store(store, monkeypatch):
+    job = run_job(StubStages(), ["a.md"], store)
+    monkeypatch.setattr(ingest_module, "ingest_queue", None)
+    monkeypatch.setattr(ingest_module, "job_store", JobStore(store.path))
+    monkeypatch.setattr(ingest_module, "default_stages", lambda: pytest.fail("status poll built the stages"))
+    assert get_job_progress(job.id) == job.progress()
+    assert ingest_module.ingest_queue is None
+
+def test_paths_outside_the_allowed_roots_are_refused(tmp_path):
+    allowed = tmp_path / "documents"
+    allowed.mkdir()
+    (allowed / "guide.md").write_text("text")
+    (tmp_path / "secret.md").write_text("text")
+    assert resolve_paths([str(allowed)], [str(allowed)]) == [allowed / "guide.md"]
+    for path in (tmp_path / "secret.md", allowed / ".." / "secret.md"):
+        with pytest.raises(ValueError, match="outside the allowed ingestion roots"):
+            resolve_paths([str(path)], [str(allowed)])
@@ -0,0 +1,125 @@
+"""
+Test prompt prefix reuse with a stubbed model client that records input token counts (no API keys needed)
+"""
+
+from types import SimpleNamespace
+from prompt_module import PromptBuilder, PrefixCachingModel
+from results_module import RetrievedDoc, SOURCE_DOCS, SOURCE_WEB
+
+HOT_GUIDE = "Facebook offers several campaign objectives. " * 40
+
+def count_tokens(text):
+    return max(1, len(text) // 4)
+
+class RecordingModel:
+    """Stub model that records the input token count of every call"""
+    def __init__(self):
+        self.input_tokens = []
+
+    def generate_content(self, prompt):
+        self.input_tokens.append(count_tokens(prompt))
+        return SimpleNamespace(text="answer", candidates=[])
+
+class StubCacheFactory:
+    """Stands in for Gemini context caching; counts how often a prefix is uploaded"""
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.created = []
+
+    def __call__(self, model_name, prompt):
+        if self.fail:
+            raise RuntimeError("cached content is too small")
+        self.created.append(prompt.prefix_key)
+        return RecordingModel(), float("inf")
+
+def make_results():
+    packed = [
+        RetrievedDoc("Objectives text", 0.9, SOURCE_DOCS, "docs:1", metadata={"filename": "facebook_ads_guide.md", "source_path": "documents/facebook_ads_guide.md"}),
+        RetrievedDoc("Business Manager text", 0.8, SOURCE_DOCS, "docs:2", metadata={"filename": "business_manager_guide.txt", "source_path": "documents/business_manager_guide.txt"}),
+        RetrievedDoc("A web snippet", 0.7, SOURCE_WEB, "web:x"),
+    ]
+    return packed, [result.text for result in packed]
+
+def test_stable_content_comes_first():
+    builder = PromptBuilder(lambda: {"documents/facebook_ads_guide.md": HOT_GUIDE})
+    packed, parts = make_results()
+    prompt = builder.build("What objectives exist?", packed, parts)
+    assert prompt.prefix.startswith(prompt.system_instruction)
+    assert HOT_GUIDE in prompt.prefix and "What objectives exist?" not in prompt.prefix
+    # The hot document hit points at the prefix instead of repeating its text
+    assert "Objectives text" not in prompt.delta and "[1] See reference document" in prompt.delta
+    assert "[2] Business Manager text" in prompt.delta
+
+def test_plain_prompt_leaves_out_hot_documents():
+    builder = PromptBuilder(lambda: {"documents/facebook_ads_guide.md": HOT_GUIDE})
+    packed, parts = make_results()
+    prompt = builder.build("What objectives exist?", packed, parts)
+    assert prompt.text.startswith(prompt.system_instruction) and HOT_GUIDE not in prompt.text
+    assert "[1] Objectives text" in prompt.text and "See reference document" not in prompt.text
+
+def test_prefix_key_is_stable_across_queries():
+    builder = PromptBuilder(lambda: {"documents/facebook_ads_guide.md": HOT_GUIDE})
+    packed, parts = make_results()
+    first = builder.build("q1", packed, parts)
+    second = builder.build("q2", packed[1:], parts[1:])
+    assert first.prefix_key == second.prefix_key and first.prefix == second.prefix
+
+def test_cached_prefix_sends_only_delta():
+    builder = PromptBuilder(lambda: {"documents/facebook_ads_guide.md": HOT_GUIDE})
+    factory = StubCacheFactory()
+    base = RecordingModel()
+    model = PrefixCachingModel("gemini-test", base, factory)
+    packed, parts = make_results()
+    prompts = [builder.build(f"question {i}", packed, parts) for i in range(5)]
+    for prompt in prompts:
+        model.generate_content(prompt)
+
+    assert len(factory.created) == 1 and not base.input_tokens
+    stats = model.stats()
+    assert stats["prefix_creations"] == 1 and stats["prefix_hits"] == 4
+    assert stats["prefix_hit_rate"] == 0.8
+    assert stats["sent_chars"] == sum(len(prompt.delta) for prompt in prompts)
+
+def test_recorded_input_tokens_shrink_with_cache():
+    builder = PromptBuilder(lambda: {"documents/facebook_ads_guide.md": HOT_GUIDE})
+    packed, parts = make_results()
+    prompt = builder.build("What objectives exist?", packed, parts)
+
+    inline = RecordingModel()
+    PrefixCachingModel("gemini-test", inline, StubCacheFactory(), enabled=False).generate_content(prompt)
+    cached_model = RecordingModel()
+    PrefixCachingModel("gemini-test", RecordingModel(), lambda name, p: (cached_model, float("inf"))).generate_content(prompt)
+
+    assert inline.input_tokens[0] == count_tokens(prompt.text)
+    assert cached_model.input_tokens[0] == count_tokens(prompt.delta)
+    # Neither path pays for the hot documents on every request
+    assert inline.input_tokens[0] < count_tokens(prompt.prefix)
+    assert cached_model.input_tokens[0] < inline.input_tokens[0]
+
+def test_falls_back_to_inline_when_caching_fails():
+    builder = PromptBuilder(lambda: {"documents/facebook_ads_guide.md": HOT_GUIDE})
+    factory = StubCacheFactory(fail=True)
+    base = RecordingModel()
+    model = PrefixCachingModel("gemini-test", base, factory)
+    packed, parts = make_results()
+    for i in range(3):
+        model.generate_content(builder.build(f"question {i}", packed, parts))
+    assert len(base.input_tokens) == 3 and model.stats()["inline_requests"] == 3
+
+def test_plain_string_prompts_pass_through():
+    base = RecordingModel()
+    PrefixCachingModel("gemini-test", base, StubCacheFactory()).generate_content("What is 2+2?")
+    assert base.input_tokens == [count_tokens("What is 2+2?")]
+
+if __name__ == "__main__":
+    print("=== Prompt Prefix Cache Test ===")
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_") and callable(value)]
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test.__name__}: {e}")
+    print(f"\nPassed: {passed}/{len(tests)} tests")
@@ -0,0 +1,99 @@
+"""
+Test circuit breakers and deadline-capped guarded calls with stub callables (no services needed)
+"""
+
+import threading
+import time
+
+import pytest
+
+from resilience_module import (
+    BREAKERS, CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, guarded_call
+)
+
+class StubService:
+    """Callable that fails, hangs or answers on demand"""
+    def __init__(self):
+        self.fail = False
+        self.hang = None  # event the call blocks on
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.hang is not None:
+            self.hang.wait(5)
+        if self.fail:
+            raise ConnectionError("service down")
+        return "ok"
+
+@pytest.fixture
+def stub():
+    BREAKERS["stub"] = CircuitBreaker("stub", timeout=0.2, failure_threshold=2, reset_seconds=0.1)
+    service = StubService()
+    yield service
+    if service.hang is not None:
+        service.hang.set()
+    del BREAKERS["stub"]
+
+def test_consecutive_failures_trip_the_breaker(stub):
+    stub.fail = True
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            guarded_call("stub", stub)
+    status = BREAKERS["stub"].status()
+    assert status["state"] == CircuitBreaker.OPEN and status["trip_count"] == 1
+
+def test_open_breaker_rejects_without_calling(stub):
+    stub.fail = True
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            guarded_call("stub", stub)
+    with pytest.raises(CircuitOpenError):
+        guarded_call("stub", stub)
+    assert stub.calls == 2 and BREAKERS["stub"].status()["rejected"] == 1
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("probe", timeout=1, failure_threshold=1, reset_seconds=0.05)
+    assert breaker.allow()
+    breaker.record_failure(ConnectionError("down"))
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    # Concurrent callers are rejected while the probe is in flight
+    assert not breaker.allow()
+
+def test_failed_probe_reopens_and_successful_probe_closes(stub):
+    stub.fail = True
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            guarded_call("stub", stub)
+    time.sleep(0.11)
+    with pytest.raises(ConnectionError):
+        guarded_call("stub", stub)
+    assert BREAKERS["stub"].state == CircuitBreaker.OPEN
+
+    stub.fail = False
+    time.sleep(0.11)
+    assert guarded_call("stub", stub) == "ok"
+    assert BREAKERS["stub"].state == CircuitBreaker.CLOSED and BREAKERS["stub"].consecutive_failures == 0
+
+def test_dependency_timeout_counts_as_failure(stub):
+    stub.hang = threading.Event()
+    with pytest.raises(DeadlineExceeded):
+        guarded_call("stub", stub)
+    status = BREAKERS["stub"].status()
+    assert status["failures"] == 1 and status["timeouts"] == 1
+
+def test_deadline_capped_timeout_is_abandoned_not_failed(stub):
+    stub.hang = threading.Event()
+    for _ in range(3):
+        with pytest.raises(DeadlineExceeded):
+            guarded_call("stub", stub, deadline=Deadline(0.05))
+    status = BREAKERS["stub"].status()
+    assert status["failures"] == 0 and status["state"] == CircuitBreaker.CLOSED
+
+def test_expired_deadline_skips_the_call(stub):
+    deadline = Deadline(0.0)
+    with pytest.raises(DeadlineExceeded):
+        guarded_call("stub", stub, deadline=deadline)
+    assert stub.calls == 0 and BREAKERS["stub"].status()["calls"] == 0
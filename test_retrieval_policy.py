@@ -0,0 +1,83 @@
+"""
+Test the adaptive retrieval policy and its threshold calibration (no index needed)
+"""
+
+import json
+
+from policy_module import (
+    RetrievalPolicy, build_policy, calibrate, load_calibration,
+    DECISION_CONFIDENT, DECISION_FLAT, DECISION_DEFAULT, DECISION_NO_DOCS, DECISION_DISABLED
+)
+
+def make_policy(**kwargs):
+    return RetrievalPolicy(**{"base_k": 3, "max_k": 8, "confident_score": 0.6, "flat_spread": 0.03, **kwargs})
+
+def test_confident_top_hit_skips_web_search():
+    decision = make_policy().decide([0.71, 0.5, 0.42, 0.4])
+    assert decision.kind == DECISION_CONFIDENT and not decision.search_web and decision.top_k == 3
+
+def test_flat_scores_widen_top_k_and_keep_web_search():
+    decision = make_policy().decide([0.45, 0.44, 0.43, 0.42, 0.41])
+    assert decision.kind == DECISION_FLAT and decision.search_web and decision.top_k == 8
+
+def test_clear_but_weak_winner_keeps_default():
+    decision = make_policy().decide([0.5, 0.35, 0.3])
+    assert decision.kind == DECISION_DEFAULT and decision.search_web and decision.top_k == 3
+
+def test_no_hits_and_disabled_policy_search_the_web():
+    assert make_policy().decide([]).kind == DECISION_NO_DOCS
+    disabled = make_policy(enabled=False)
+    assert disabled.search_k == 3
+    decision = disabled.decide([0.9, 0.2])
+    assert decision.kind == DECISION_DISABLED and decision.search_web
+
+def test_stats_count_decisions():
+    policy = make_policy()
+    for scores in ([0.8], [0.8, 0.2], [0.4, 0.39, 0.39], []):
+        policy.decide(scores)
+    stats = policy.stats()
+    assert stats["decisions"][DECISION_CONFIDENT] == 2 and stats["web_searches_skipped"] == 2
+    assert stats["web_skip_rate"] == 0.5
+
+def test_calibrate_finds_precise_threshold_and_flat_spread():
+    samples = [
+        ([0.80, 0.5, 0.4], True, True),
+        ([0.75, 0.5, 0.4], True, True),
+        ([0.70, 0.6, 0.5], True, True),
+        ([0.65, 0.6, 0.5], False, True),
+        ([0.50, 0.49, 0.49], False, False),
+        ([0.48, 0.47, 0.47], False, False),
+        ([0.55, 0.30, 0.20], True, True),
+    ]
+    suggestion = calibrate(samples, base_k=3, target_precision=0.9)
+    assert suggestion["confident_score"] == 0.7 and suggestion["confident_precision"] == 1.0
+    assert 0.01 <= suggestion["flat_spread"] < 0.2
+    policy = make_policy(confident_score=suggestion["confident_score"], flat_spread=suggestion["flat_spread"])
+    assert policy.decide([0.50, 0.49, 0.49]).kind == DECISION_FLAT
+    assert policy.decide([0.55, 0.30, 0.20]).kind == DECISION_DEFAULT
+
+def test_unset_thresholds_never_trigger():
+    policy = make_policy(confident_score=None, flat_spread=None)
+    assert policy.decide([0.99, 0.2]).kind == DECISION_DEFAULT
+    assert policy.decide([0.4, 0.4, 0.4]).kind == DECISION_DEFAULT
+
+def write_calibration(tmp_path, **fields):
+    path = tmp_path / "retrieval_calibration.json"
+    path.write_text(json.dumps({"model": "minilm", "base_k": 3, "max_k": 8,
+                                "confident_score": 0.7, "flat_spread": 0.02, **fields}))
+    return str(path)
+
+def test_calibration_file_turns_the_policy_on(tmp_path):
+    calibration = load_calibration(write_calibration(tmp_path), "minilm", 3, 8)
+    policy = build_policy("auto", calibration, 3, 8)
+    assert policy.enabled and policy.confident_score == 0.7 and policy.flat_spread == 0.02
+    assert build_policy("false", calibration, 3, 8).enabled is False
+    assert build_policy("auto", calibration, 3, 8, confident_score=0.8).confident_score == 0.8
+
+def test_missing_or_foreign_calibration_keeps_the_policy_off(tmp_path):
+    assert load_calibration(str(tmp_path / "missing.json"), "minilm", 3, 8) is None
+    assert load_calibration(write_calibration(tmp_path, model="other"), "minilm", 3, 8) is None
+    assert load_calibration(write_calibration(tmp_path), "minilm", 5, 8) is None
+    for mode in ("auto", "true"):
+        assert not build_policy(mode, None, 3, 8).enabled
+    assert build_policy("auto", None, 3, 8, flat_spread=0.02).enabled  # explicit thresholds need no file
@@ -0,0 +1,89 @@
+"""
+Test the tiered model router with stubbed models (no API keys needed)
+"""
+
+from types import SimpleNamespace
+from routing_module import ModelRouter, ModelTier, FINISH_STOP, FINISH_SAFETY
+
+class StubModel:
+    """Records prompts and returns canned responses"""
+    def __init__(self, text, finish_reason=FINISH_STOP, error=None):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.error = error
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        if self.error:
+            raise self.error
+        candidate = SimpleNamespace(finish_reason=self.finish_reason, content=None)
+        return SimpleNamespace(text=self.text, candidates=[candidate])
+
+def make_router(fast_model, pro_model, **kwargs):
+    return ModelRouter(ModelTier("fast", fast_model, 0.3, 2.5), ModelTier("pro", pro_model, 1.25, 10.0), **kwargs)
+
+def test_confident_simple_query_stays_on_fast_tier():
+    fast, pro = StubModel("Custom audiences reach existing customers."), StubModel("pro answer")
+    routed = make_router(fast, pro).generate("prompt", "What are custom audiences?", [0.82, 0.6])
+    assert routed.tier == "fast" and not routed.escalated
+    assert len(fast.prompts) == 1 and not pro.prompts
+
+def test_low_retrieval_score_goes_straight_to_pro():
+    fast, pro = StubModel("fast answer"), StubModel("pro answer")
+    routed = make_router(fast, pro).generate("prompt", "What are custom audiences?", [0.2])
+    assert routed.tier == "pro" and not fast.prompts
+
+def test_complex_wording_goes_straight_to_pro():
+    fast, pro = StubModel("fast answer"), StubModel("pro answer")
+    routed = make_router(fast, pro).generate("prompt", "Compare reach and awareness objectives", [0.9])
+    assert routed.tier == "pro" and not fast.prompts
+
+def test_uncertain_fast_answer_escalates():
+    fast = StubModel("The context doesn't fully answer this question.")
+    pro = StubModel("pro answer")
+    router = make_router(fast, pro)
+    routed = router.generate("prompt", "What are custom audiences?", [0.9])
+    assert routed.tier == "pro" and routed.escalated and routed.text == "pro answer"
+    assert router.stats()["escalations"] == 1
+
+def test_fast_error_escalates():
+    fast, pro = StubModel(None, error=RuntimeError("boom")), StubModel("pro answer")
+    router = make_router(fast, pro)
+    routed = router.generate("prompt", "What are custom audiences?", [0.9])
+    assert routed.text == "pro answer"
+    assert router.stats()["tiers"]["fast"]["failures"] == 1
+
+def test_safety_block_is_not_escalated():
+    fast, pro = StubModel(None, finish_reason=FINISH_SAFETY), StubModel("pro answer")
+    routed = make_router(fast, pro).generate("prompt", "What are custom audiences?", [0.9])
+    assert routed.finish_reason == FINISH_SAFETY and not pro.prompts
+
+def test_weak_answer_kept_when_pro_would_miss_slo():
+    fast = StubModel("Not enough information, but custom audiences use customer lists.")
+    pro = StubModel("pro answer")
+    router = make_router(fast, pro, latency_slo_ms=1000)
+    router.pro.ewma_latency = 5.0  # pro is known to take ~5s
+    routed = router.generate("prompt", "What are custom audiences?", [0.9])
+    assert routed.tier == "fast" and not pro.prompts
+
+def test_cost_accounting():
+    fast, pro = StubModel("x" * 400), StubModel("pro answer")
+    router = make_router(fast, pro)
+    router.generate("p" * 4000, "What are custom audiences?", [0.9])
+    tier = router.stats()["tiers"]["fast"]
+    assert tier["input_tokens"] == 1000 and tier["output_tokens"] == 100
+    assert abs(tier["cost_usd"] - (1000 * 0.3 + 100 * 2.5) / 1_000_000) < 1e-9
+
+if __name__ == "__main__":
+    print("=== Model Router Test ===")
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_") and callable(value)]
+    passed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__}")
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test.__name__}: {e}")
+    print(f"\nPassed: {passed}/{len(tests)} tests")
@@ -0,0 +1,40 @@
+"""
+Test the SQLite cache tier shared by worker processes (no services needed)
+"""
+
+import multiprocessing
+
+from shared_cache import SharedCache
+
+def put_from_other_process(path, key, value):
+    SharedCache(path, namespace="embeddings").put(key, value)
+
+def test_put_and_get_round_trip_bytes(tmp_path):
+    cache = SharedCache(str(tmp_path / "shared.db"))
+    assert cache.get("q") is None
+    cache.put("q", b"\x00\x01vector")
+    assert cache.get("q") == b"\x00\x01vector"
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["size"] == 1 and stats["errors"] == 0
+
+def test_entry_written_by_another_process_is_a_hit(tmp_path):
+    path = str(tmp_path / "shared.db")
+    cache = SharedCache(path, namespace="embeddings")
+    process = multiprocessing.get_context("spawn").Process(target=put_from_other_process, args=(path, "q", b"from worker 2"))
+    process.start()
+    process.join(30)
+    assert process.exitcode == 0
+    assert cache.get("q") == b"from worker 2"
+
+def test_namespaces_do_not_see_each_other(tmp_path):
+    path = str(tmp_path / "shared.db")
+    minilm, other = SharedCache(path, namespace="minilm"), SharedCache(path, namespace="other")
+    minilm.put("q", b"a")
+    assert other.get("q") is None and other.stats()["size"] == 0
+
+def test_oldest_entries_are_evicted_beyond_max_entries(tmp_path):
+    cache = SharedCache(str(tmp_path / "shared.db"), max_entries=10)
+    for i in range(500):  # eviction runs every 500 writes
+        cache.put(f"q{i}", b"v")
+    assert cache.stats()["size"] == 10
+    assert cache.get("q499") == b"v" and cache.get("q0") is None
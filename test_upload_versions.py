@@ -0,0 +1,77 @@
+"""
+Test that re-uploading a file retires its previous points, on an in-memory Qdrant (no server or model needed)
+"""
+
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+import upload_enhanced
+from chunk_store import ChunkStore
+from rag_module import QDRANT_COLLECTION
+
+SOURCE = "documents/uploads/guide.md"
+OTHER = "documents/uploads/other.md"
+
+def docs(source, count):
+    return [{"text": f"{source} chunk {i}", "filename": source.rsplit("/", 1)[-1], "source": source,
+             "file_type": ".md", "chunk_id": i, "total_chunks": count} for i in range(count)]
+
+def upsert(client, documents, ingested_at):
+    client.upsert(QDRANT_COLLECTION, points=[upload_enhanced.make_point(doc, i, [1.0, 0.0, 0.0, float(i)], ingested_at)
+                                             for i, doc in enumerate(documents)])
+
+def stored(client, source):
+    points, _ = client.scroll(QDRANT_COLLECTION, scroll_filter=models.Filter(must=[
+        models.FieldCondition(key="source", match=models.MatchValue(value=source))]), limit=100)
+    return sorted((p.payload["chunk_id"], p.payload.get("ingested_at")) for p in points)
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    client = QdrantClient(":memory:")
+    client.create_collection(QDRANT_COLLECTION, vectors_config=models.VectorParams(size=4, distance=models.Distance.COSINE))
+    monkeypatch.setattr(upload_enhanced, "client", client)
+    monkeypatch.setattr(upload_enhanced, "chunk_store", ChunkStore(str(tmp_path / "chunks.db")))
+    return client
+
+def test_finish_file_drops_older_versions_and_extra_chunks(client):
+    upsert(client, docs(SOURCE, 3), ingested_at=100)
+    new = docs(SOURCE, 2)
+    upsert(client, new, ingested_at=200)
+    upload_enhanced.finish_file(new, 200)
+    assert stored(client, SOURCE) == [(0, 200), (1, 200)]
+    assert upload_enhanced.chunk_store.get_range(SOURCE, 0, 5) == {0: new[0]["text"], 1: new[1]["text"]}
+
+def test_finish_file_drops_points_without_ingested_at(client):
+    # Written by the uploader before points recorded ingested_at
+    legacy = [models.PointStruct(id=i, vector=[0.0, 1.0, 0.0, 0.0],
+                                 payload={"text": "old", "source": SOURCE, "chunk_id": i}) for i in range(4)]
+    client.upsert(QDRANT_COLLECTION, points=legacy)
+    new = docs(SOURCE, 2)
+    upsert(client, new, ingested_at=200)
+    upload_enhanced.finish_file(new, 200)
+    assert stored(client, SOURCE) == [(0, 200), (1, 200)]
+
+def test_finish_file_leaves_other_sources_alone(client):
+    upsert(client, docs(OTHER, 2), ingested_at=100)
+    new = docs(SOURCE, 1)
+    upsert(client, new, ingested_at=200)
+    upload_enhanced.finish_file(new, 200)
+    assert stored(client, OTHER) == [(0, 100), (1, 100)]
+
+def test_reupload_writes_new_points_next_to_the_previous_version(client):
+    old = docs(SOURCE, 2)
+    assert upload_enhanced.make_point(old[0], 0, [1.0] * 4, 100).id != upload_enhanced.make_point(old[0], 0, [1.0] * 4, 200).id
+    upsert(client, old, ingested_at=100)
+    upsert(client, docs(SOURCE, 3), ingested_at=200)
+    assert stored(client, SOURCE) == [(0, 100), (0, 200), (1, 100), (1, 200), (2, 200)]
+
+def test_discard_file_rolls_back_a_partial_upload(client):
+    old = docs(SOURCE, 3)
+    upsert(client, old, ingested_at=100)
+    upload_enhanced.finish_file(old, 100)
+    new = docs(SOURCE, 3)
+    upsert(client, new[:1], ingested_at=200)  # the other chunks failed
+    upload_enhanced.discard_file(new, 200)
+    assert stored(client, SOURCE) == [(0, 100), (1, 100), (2, 100)]
+    assert upload_enhanced.chunk_store.get_range(SOURCE, 0, 2, ingested_at=100) == {i: d["text"] for i, d in enumerate(old)}
@@ -3,29 +3,23 @@ Enhanced script to upload documents from various file formats to Qdrant
 Supports: .txt, .md, .pdf, .docx files
 """
 
-from qdrant_client import QdrantClient
 from qdrant_client.http import models
-import sentence_transformers
 import json
 import os
 import re
+import time
+import uuid
 from pathlib import Path
-from config import QDRANT_URL, QDRANT_API_KEY
+from config import EMBED_CHUNK_CHARS, CHUNK_OVERLAP_CHARS, INGEST_ALLOWED_ROOTS
+from embedding_module import get_embedding_model, embed_query
+from chunk_store import chunk_text
+from rag_module import client, chunk_store, QDRANT_COLLECTION, KEYWORD_INDEX_FIELDS, INTEGER_INDEX_FIELDS
 
 # File format processors
 import PyPDF2
 from docx import Document
 import markdown
 
-QDRANT_COLLECTION = "DM_docs"
-
-# Connect to Qdrant Cloud
-client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
-print(f"Connected to Qdrant Cloud: {QDRANT_URL}")
-
-# Initialize embedding model
-model = sentence_transformers.SentenceTransformer("all-MiniLM-L6-v2")
-
 def extract_text_from_pdf(file_path):
     """Extract text from PDF file"""
     try:
@@ -75,35 +69,66 @@ def extract_text_from_txt(file_path):
         print(f"Error reading TXT {file_path}: {e}")
         return ""
 
-def chunk_text(text, max_chars=1000, overlap=100):
-    """Split text into overlapping chunks for better retrieval"""
-    if len(text) <= max_chars:
-        return [text]
+SUPPORTED_EXTENSIONS = {'.txt', '.md', '.pdf', '.docx'}
+
+def extract_text(file_path):
+    """Extract text based on file type ("" for unsupported files)"""
+    suffix = Path(file_path).suffix.lower()
+    if suffix == '.pdf':
+        return extract_text_from_pdf(file_path)
+    elif suffix == '.docx':
+        return extract_text_from_docx(file_path)
+    elif suffix == '.md':
+        return extract_text_from_markdown(file_path)
+    elif suffix == '.txt':
+        return extract_text_from_txt(file_path)
+    return ""
+
+def source_path(file_path, roots=INGEST_ALLOWED_ROOTS):
+    """
+    Normalized `source` for a file, the same however it was ingested: a POSIX path
+    starting at its ingestion root (e.g. documents/uploads/guide.md), relative to
+    the working directory for files outside every root
+    """
+    path = Path(file_path).resolve()
+    # Innermost root first, in case roots are nested
+    for root in sorted((Path(r).resolve() for r in roots), key=lambda r: len(r.parts), reverse=True):
+        if path == root or root in path.parents:
+            return path.relative_to(root.parent).as_posix()
+    try:
+        return path.relative_to(Path.cwd()).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+def chunk_file(file_path):
+    """Extract and chunk one file into document dicts ready for upload_documents"""
+    file_path = Path(file_path)
+    text = extract_text(file_path)
+    if not text:
+        return []
     
-    chunks = []
-    start = 0
+    # Split into small chunks for search; retrieval expands hits back to their neighbors
+    chunks = chunk_text(text, max_chars=EMBED_CHUNK_CHARS, overlap=CHUNK_OVERLAP_CHARS)
     
-    while start < len(text):
-        end = start + max_chars
-        
-        # Try to end at a sentence boundary
-        if end < len(text):
-            # Look for sentence endings near the chunk boundary
-            for i in range(end, max(start + max_chars - 200, start), -1):
-                if text[i] in '.!?':
-                    end = i + 1
-                    break
-        
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-        
-        start = end - overlap
-        
-        if start >= len(text):
-            break
-    
-    return chunks
+    documents = []
+    for i, chunk in enumerate(chunks):
+        documents.append({
+            'text': chunk,
+            'title': f"{file_path.stem} (Part {i+1})" if len(chunks) > 1 else file_path.stem,
+            'filename': file_path.name,
+            'source': source_path(file_path),
+            'file_type': file_path.suffix.lower(),
+            'chunk_id': i if len(chunks) > 1 else 0,
+            'total_chunks': len(chunks)
+        })
+    return documents
+
+def find_documents(folder_path):
+    """All supported files under a folder"""
+    return sorted(
+        file_path for file_path in Path(folder_path).rglob('*')
+        if file_path.is_file() and file_path.suffix.lower() in SUPPORTED_EXTENSIONS
+    )
 
 def process_documents_from_folder(folder_path="./documents"):
     """Process documents from a folder containing various file formats"""
@@ -114,47 +139,110 @@ def process_documents_from_folder(folder_path="./documents"):
         return []
     
     documents = []
-    supported_extensions = {'.txt', '.md', '.pdf', '.docx'}
     
-    for file_path in Path(folder_path).rglob('*'):
-        if file_path.is_file() and file_path.suffix.lower() in supported_extensions:
-            print(f"Processing: {file_path.name}")
-            
-            # Extract text based on file type
-            if file_path.suffix.lower() == '.pdf':
-                text = extract_text_from_pdf(file_path)
-            elif file_path.suffix.lower() == '.docx':
-                text = extract_text_from_docx(file_path)
-            elif file_path.suffix.lower() == '.md':
-                text = extract_text_from_markdown(file_path)
-            elif file_path.suffix.lower() == '.txt':
-                text = extract_text_from_txt(file_path)
-            else:
-                continue
-            
-            if text:
-                # Split large documents into chunks
-                chunks = chunk_text(text, max_chars=800, overlap=100)
-                
-                for i, chunk in enumerate(chunks):
-                    doc_id = f"{file_path.stem}_{i}" if len(chunks) > 1 else file_path.stem
-                    documents.append({
-                        'text': chunk,
-                        'title': f"{file_path.stem} (Part {i+1})" if len(chunks) > 1 else file_path.stem,
-                        'filename': file_path.name,
-                        'source': str(file_path),
-                        'file_type': file_path.suffix.lower(),
-                        'chunk_id': i if len(chunks) > 1 else 0,
-                        'total_chunks': len(chunks)
-                    })
-                
-                print(f"  → Extracted {len(chunks)} chunk(s)")
-            else:
-                print(f"  → No text extracted from {file_path.name}")
+    for file_path in find_documents(folder_path):
+        print(f"Processing: {file_path.name}")
+        
+        file_documents = chunk_file(file_path)
+        if file_documents:
+            documents.extend(file_documents)
+            print(f"  → Extracted {len(file_documents)} chunk(s)")
+        else:
+            print(f"  → No text extracted from {file_path.name}")
     
     print(f"\nTotal documents processed: {len(documents)}")
     return documents
 
+def ensure_collection():
+    """Create the collection if it does not exist yet (e.g. a fresh local index)"""
+    if client.collection_exists(QDRANT_COLLECTION):
+        return
+    client.create_collection(
+        collection_name=QDRANT_COLLECTION,
+        vectors_config=models.VectorParams(
+            size=get_embedding_model().get_sentence_embedding_dimension(),
+            distance=models.Distance.COSINE
+        )
+    )
+    print(f"Created collection: {QDRANT_COLLECTION}")
+
+def create_payload_indexes():
+    """Index the payload fields used by filtered retrieval so narrow filters stay cheap"""
+    indexes = [(name, models.PayloadSchemaType.KEYWORD) for name in KEYWORD_INDEX_FIELDS]
+    indexes += [(name, models.PayloadSchemaType.INTEGER) for name in INTEGER_INDEX_FIELDS]
+    for field_name, schema in indexes:
+        try:
+            client.create_payload_index(QDRANT_COLLECTION, field_name=field_name, field_schema=schema)
+        except Exception as e:
+            print(f"Error creating payload index on {field_name}: {e}")
+    print(f"Payload indexes ensured on: {', '.join(KEYWORD_INDEX_FIELDS + INTEGER_INDEX_FIELDS)}")
+
+def point_id(doc, i, ingested_at):
+    """
+    Id per (source path, upload, chunk): a re-upload writes new points next to the
+    previous version instead of overwriting it, so a failed upload can be rolled back
+    """
+    if doc.get('source'):
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc['source']}#{ingested_at}#{doc.get('chunk_id', 0)}"))
+    return i
+
+def group_by_source(documents):
+    """{source: chunks in chunk_id order} for the documents of one upload"""
+    by_file = {}
+    for doc in documents:
+        if doc.get('source'):
+            by_file.setdefault(doc['source'], []).append(doc)
+    for file_docs in by_file.values():
+        file_docs.sort(key=lambda doc: doc.get('chunk_id', 0))
+    return by_file
+
+def finish_file(file_docs, ingested_at):
+    """
+    Once all of a file's new points are stored: drop every other point of that
+    source (chunks past the new end, older versions, points written before
+    ingested_at was recorded) and store its chunks for neighbour expansion.
+    """
+    source = file_docs[0]['source']
+    try:
+        client.delete(
+            collection_name=QDRANT_COLLECTION,
+            points_selector=models.FilterSelector(filter=models.Filter(
+                must=[models.FieldCondition(key="source", match=models.MatchValue(value=source))],
+                must_not=[models.FieldCondition(key="ingested_at", match=models.MatchValue(value=ingested_at))]
+            ))
+        )
+    except Exception as e:
+        print(f"Error removing old points for {source}: {e}")
+    chunk_store.replace_file(source, file_docs[0].get('filename', ''), [doc['text'] for doc in file_docs], ingested_at)
+
+def discard_file(file_docs, ingested_at):
+    """Roll back a file whose upload did not complete: delete the points this upload wrote for it"""
+    source = file_docs[0]['source']
+    client.delete(
+        collection_name=QDRANT_COLLECTION,
+        points_selector=models.FilterSelector(filter=models.Filter(must=[
+            models.FieldCondition(key="source", match=models.MatchValue(value=source)),
+            models.FieldCondition(key="ingested_at", match=models.MatchValue(value=ingested_at)),
+        ]))
+    )
+
+def make_point(doc, i, embedding, ingested_at):
+    """Qdrant point for one chunk of the upload started at ingested_at"""
+    return models.PointStruct(
+        id=point_id(doc, i, ingested_at),
+        vector=[float(x) for x in embedding],
+        payload={
+            'text': doc['text'],
+            'title': doc.get('title', f'Document {i}'),
+            'filename': doc.get('filename', ''),
+            'source': doc.get('source', 'unknown'),
+            'file_type': doc.get('file_type', ''),
+            'chunk_id': doc.get('chunk_id', 0),
+            'total_chunks': doc.get('total_chunks', 1),
+            'ingested_at': ingested_at
+        }
+    )
+
 def upload_documents(documents):
     """Upload a list of documents to Qdrant"""
     if not documents:
@@ -162,30 +250,17 @@ def upload_documents(documents):
         return
     
     print(f"Uploading {len(documents)} document chunks...")
+    ensure_collection()
+    create_payload_indexes()
+    ingested_at = int(time.time())
     
-    points = []
-    for i, doc in enumerate(documents):
-        # Generate embedding
-        embedding = model.encode(doc['text']).tolist()
-        
-        # Create point
-        point = models.PointStruct(
-            id=i,
-            vector=embedding,
-            payload={
-                'text': doc['text'],
-                'title': doc.get('title', f'Document {i}'),
-                'filename': doc.get('filename', ''),
-                'source': doc.get('source', 'unknown'),
-                'file_type': doc.get('file_type', ''),
-                'chunk_id': doc.get('chunk_id', 0),
-                'total_chunks': doc.get('total_chunks', 1)
-            }
-        )
-        points.append(point)
+    # Generate embeddings in batches
+    embeddings = get_embedding_model().encode([doc['text'] for doc in documents], batch_size=32)
+    points = [make_point(doc, i, embedding, ingested_at) for i, (doc, embedding) in enumerate(zip(documents, embeddings))]
     
     # Upload to Qdrant in batches
     batch_size = 100
+    failed_sources = set()
     for i in range(0, len(points), batch_size):
         batch = points[i:i + batch_size]
         try:
@@ -196,6 +271,19 @@ def upload_documents(documents):
             print(f"Uploaded batch {i//batch_size + 1}/{(len(points) + batch_size - 1)//batch_size}")
         except Exception as e:
             print(f"Error uploading batch {i//batch_size + 1}: {e}")
+            failed_sources.update(doc.get('source') for doc in documents[i:i + batch_size])
+    
+    # Retire the previous version of each file only once its new points are all stored,
+    # otherwise roll back the points of this upload
+    for source, file_docs in group_by_source(documents).items():
+        if source not in failed_sources:
+            finish_file(file_docs, ingested_at)
+            continue
+        try:
+            discard_file(file_docs, ingested_at)
+            print(f"Kept the previous version of {source}: not all of its chunks were uploaded")
+        except Exception as e:
+            print(f"Error rolling back {source}, it now mixes two versions until re-uploaded: {e}")
     
     try:
         # Show collection info
@@ -209,15 +297,15 @@ def test_search(query="Facebook Ads targeting"):
     print(f"\nTesting search with query: '{query}'")
     
     # Generate query embedding
-    query_embedding = model.encode(query).tolist()
+    query_embedding = embed_query(query)
     
     # Search
     try:
-        search_result = client.search(
+        search_result = client.query_points(
             collection_name=QDRANT_COLLECTION,
-            query_vector=query_embedding,
+            query=query_embedding,
             limit=5
-        )
+        ).points
         
         print("Search results:")
         for i, hit in enumerate(search_result):